@@ -3,15 +3,129 @@ import os
 
 load_dotenv()
 
+def _parse_mapping(value: str) -> dict:
+    """Parses "KEY=value,KEY2=value2" into a dict"""
+    return dict(item.split("=", 1) for item in value.split(",") if "=" in item)
+
 class Config:
     bot_token = os.getenv("BOT_TOKEN")
     encryption_key = os.getenv("ENCRYPTION_KEY")
     admin_telegram_ids = [int(x) for x in os.getenv("ADMIN_TELEGRAM_IDS", "").split(",") if x]
     database_path = os.getenv("DATABASE_PATH", "escrow_data.db")
+    # Number of read-only connections kept open in the database pool
+    db_reader_connections = int(os.getenv("DB_READER_CONNECTIONS", "4"))
+    # Group commit: max writes per transaction and how long to wait for more (ms)
+    write_batch_size = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+    write_batch_delay_ms = float(os.getenv("WRITE_BATCH_DELAY_MS", "2"))
+    # In-process user cache: entries per lookup key and lifetime in seconds
+    user_cache_size = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    user_cache_ttl = int(os.getenv("USER_CACHE_TTL", "300"))
+    # Bloom filter of existing deal IDs so lookups of unknown IDs skip the database (0 disables it).
+    # Sized to at least twice the deals present at startup; refreshed for deals made by other processes
+    deal_id_filter_capacity = int(os.getenv("DEAL_ID_FILTER_CAPACITY", "100000"))
+    deal_id_filter_error_rate = float(os.getenv("DEAL_ID_FILTER_ERROR_RATE", "0.001"))
+    deal_id_filter_refresh_interval = int(os.getenv("DEAL_ID_FILTER_REFRESH_INTERVAL", "30"))
+    # Deal IDs reserved per database round trip; unused ones are skipped after a restart
+    deal_id_block_size = int(os.getenv("DEAL_ID_BLOCK_SIZE", "100"))
+    # Per-user flood limits: sustained rate per second and burst, for messages and button presses
+    throttle_message_rate = float(os.getenv("THROTTLE_MESSAGE_RATE", "1"))
+    throttle_message_burst = int(os.getenv("THROTTLE_MESSAGE_BURST", "5"))
+    throttle_callback_rate = float(os.getenv("THROTTLE_CALLBACK_RATE", "2"))
+    throttle_callback_burst = int(os.getenv("THROTTLE_CALLBACK_BURST", "10"))
+    # How often expired deposit address reservations are released (seconds)
+    address_sweep_interval = int(os.getenv("ADDRESS_SWEEP_INTERVAL", "300"))
     admin_username = os.getenv("ADMIN_USERNAME", "")
     
     # API key for BlockCypher
     blockcypher_api_key = os.getenv("BLOCKCYPHER_API_KEY", "")
+    
+    # Blockchain providers; base URLs can point at utils/fake_provider.py for offline tests
+    blockcypher_base_url = os.getenv("BLOCKCYPHER_BASE_URL", "https://api.blockcypher.com/v1")
+    # Max addresses per BlockCypher `addrs/A;B;C` call and how long lookups wait to be batched (ms)
+    blockcypher_batch_size = int(os.getenv("BLOCKCYPHER_BATCH_SIZE", "20"))
+    blockcypher_batch_window_ms = float(os.getenv("BLOCKCYPHER_BATCH_WINDOW_MS", "50"))
+    # Keyless Esplora instances per currency, the default fallback provider
+    esplora_base_urls = _parse_mapping(
+        os.getenv("ESPLORA_BASE_URLS", "BTC=https://blockstream.info/api,LTC=https://litecoinspace.org/api")
+    )
+    etherscan_base_url = os.getenv("ETHERSCAN_BASE_URL", "https://api.etherscan.io/api")
+    etherscan_api_key = os.getenv("ETHERSCAN_API_KEY", "")
+    blockchain_providers = _parse_mapping(
+        os.getenv("BLOCKCHAIN_PROVIDERS", "BTC=blockcypher,LTC=blockcypher,ETH=etherscan")
+    )
+    # Second provider per currency, used for failover and hedged requests
+    blockchain_fallback_providers = _parse_mapping(
+        os.getenv("BLOCKCHAIN_FALLBACK_PROVIDERS", "BTC=esplora,LTC=esplora")
+    )
+    # Hedging: admin checks slower than this latency percentile of the primary also ask the fallback;
+    # until enough samples exist the default delay is used (ms)
+    hedge_requests = os.getenv("HEDGE_REQUESTS", "1") == "1"
+    hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    hedge_min_delay_ms = float(os.getenv("HEDGE_MIN_DELAY_MS", "200"))
+    hedge_default_delay_ms = float(os.getenv("HEDGE_DEFAULT_DELAY_MS", "1000"))
+    # Confirmations required before a payment counts as received
+    min_confirmations = {
+        "BTC": int(os.getenv("MIN_CONFIRMATIONS_BTC", "3")),
+        "LTC": int(os.getenv("MIN_CONFIRMATIONS_LTC", "2")),
+        "ETH": int(os.getenv("MIN_CONFIRMATIONS_ETH", "12")),
+    }
+    # Provider quotas as "name=requests_per_second/requests_per_hour"
+    provider_rate_limits = _parse_mapping(
+        os.getenv("PROVIDER_RATE_LIMITS", "blockcypher=3/200,etherscan=5/4000,esplora=10/20000")
+    )
+    # Longest wait (s) for a request slot: admin checks, background watcher polls
+    rate_limit_interactive_wait = float(os.getenv("RATE_LIMIT_INTERACTIVE_WAIT", "10"))
+    rate_limit_background_wait = float(os.getenv("RATE_LIMIT_BACKGROUND_WAIT", "60"))
+    # Consecutive provider failures that open its circuit, and seconds before a retry probe
+    circuit_failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    circuit_reset_timeout = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+    # Address lookup cache: entries, and lifetime (s) while payments are unconfirmed or once confirmed
+    address_cache_size = int(os.getenv("ADDRESS_CACHE_SIZE", "10000"))
+    address_cache_pending_ttl = int(os.getenv("ADDRESS_CACHE_PENDING_TTL", "15"))
+    address_cache_confirmed_ttl = int(os.getenv("ADDRESS_CACHE_CONFIRMED_TTL", "600"))
+    # "polling" or "webhook"; webhook mode needs WEB_SERVER_PORT and PUBLIC_URL
+    bot_mode = os.getenv("BOT_MODE", "polling")
+    # Bot API server, e.g. a local telegram-bot-api instance; empty for api.telegram.org
+    telegram_api_url = os.getenv("TELEGRAM_API_URL", "")
+    telegram_webhook_path = os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook")
+    telegram_webhook_secret = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+    # Updates handled at once, and parallel connections Telegram may open to the webhook
+    telegram_webhook_max_concurrent = int(os.getenv("TELEGRAM_WEBHOOK_MAX_CONCURRENT", "50"))
+    telegram_webhook_max_connections = int(os.getenv("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", "40"))
+    # How long shutdown waits for updates in progress (seconds)
+    shutdown_drain_timeout = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+    # FSM storage: "sqlite" keeps conversations across restarts, "memory" is aiogram's MemoryStorage
+    fsm_storage = os.getenv("FSM_STORAGE", "sqlite")
+    # Seconds between write-behind flushes of changed conversations
+    fsm_flush_interval = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+    # Conversations kept in memory, and idle seconds before one is dropped from memory
+    fsm_cache_size = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+    fsm_cache_ttl = int(os.getenv("FSM_CACHE_TTL", "600"))
+    # Conversations without changes for this long are deleted (seconds)
+    fsm_state_ttl = int(os.getenv("FSM_STATE_TTL", "86400"))
+    # Outgoing messages: sender workers, messages per second overall and per chat
+    outbox_workers = int(os.getenv("OUTBOX_WORKERS", "8"))
+    outbox_global_rate = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))
+    outbox_per_chat_rate = float(os.getenv("OUTBOX_PER_CHAT_RATE", "1"))
+    outbox_per_chat_burst = int(os.getenv("OUTBOX_PER_CHAT_BURST", "3"))
+    outbox_max_attempts = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+    # Keep queued messages in the database so they survive a restart
+    outbox_persist = os.getenv("OUTBOX_PERSIST", "1") == "1"
+    # Prometheus /metrics endpoint (0 disables it); keep it on a local interface
+    metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    # Built-in web server for webhooks (0 disables it)
+    web_server_host = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
+    web_server_port = int(os.getenv("WEB_SERVER_PORT", "0"))
+    # Public https URL of the web server; payment webhooks are registered with providers only when set
+    public_url = os.getenv("PUBLIC_URL", "")
+    payment_webhook_secret = os.getenv("PAYMENT_WEBHOOK_SECRET", "")
+    # How often the address index and registered hooks are synced with open deals (seconds)
+    webhook_sync_interval = int(os.getenv("WEBHOOK_SYNC_INTERVAL", "15"))
+    # Background payment watcher: scan interval (s), parallel checks (batched by the provider) and checks per hour
+    payment_watch_interval = int(os.getenv("PAYMENT_WATCH_INTERVAL", "10"))
+    payment_watch_concurrency = int(os.getenv("PAYMENT_WATCH_CONCURRENCY", "20"))
+    payment_watch_checks_per_hour = int(os.getenv("PAYMENT_WATCH_CHECKS_PER_HOUR", "180"))
 
 def load_config():
     return Config()
\ No newline at end of file
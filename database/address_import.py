@@ -0,0 +1,127 @@
+"""Streaming import of the deposit address pool.
+
+Usage: python -m database.address_import [deposit_addresses.json] [--force]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sys
+from pathlib import Path
+
+logger = logging.getLogger("escrow_bot")
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Punctuation or a complete JSON string, with optional leading whitespace
+_TOKEN_RE = re.compile(r'\s*(?:([{}\[\]:,])|"((?:[^"\\]|\\.)*)")')
+_TRAILING_WHITESPACE_RE = re.compile(r"\s*$")
+
+
+def file_sha256(path: Path) -> str:
+    """Hashes a file without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _iter_tokens(f, path: Path):
+    buffer = ""
+    position = 0
+    eof = False
+    while True:
+        match = _TOKEN_RE.match(buffer, position)
+        # A match touching the end of the buffer may be cut short, read more first
+        if match and (match.end() < len(buffer) or eof):
+            position = match.end()
+            punctuation, string = match.groups()
+            yield punctuation, string
+            continue
+
+        if eof:
+            if _TRAILING_WHITESPACE_RE.match(buffer, position):
+                return
+            raise ValueError(f"Malformed address file {path} near: {buffer[position:position + 40]!r}")
+
+        chunk = f.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_address_file(path: Path):
+    """Yields (crypto_type, address) from {"BTC": [...], "LTC": [...]} one entry at a time.
+
+    Raises ValueError naming the file for any other layout.
+    """
+    def invalid(found: str) -> ValueError:
+        return ValueError(
+            f"Address file {path} must map crypto type to a list of addresses "
+            f'like {{"BTC": ["..."]}}, found {found}'
+        )
+
+    # What may come next: "start", "key" ("key_or_end" right after "{"), "colon", "list",
+    # "item" ("item_or_end" right after "["), "after_item", "after_list" or "end"
+    expected = "start"
+    current_key = None
+    with open(path, encoding="utf-8") as f:
+        for punctuation, string in _iter_tokens(f, path):
+            token = repr(punctuation) if punctuation else f"string {string[:40]!r}"
+            if expected == "start" and punctuation == "{":
+                expected = "key_or_end"
+            elif expected in ("key", "key_or_end") and punctuation is None:
+                current_key = json.loads(f'"{string}"')
+                expected = "colon"
+            elif expected == "colon" and punctuation == ":":
+                expected = "list"
+            elif expected == "list" and punctuation == "[":
+                expected = "item_or_end"
+            elif expected in ("item", "item_or_end") and punctuation is None:
+                yield current_key, json.loads(f'"{string}"')
+                expected = "after_item"
+            elif expected == "after_item" and punctuation == ",":
+                expected = "item"
+            elif expected in ("after_item", "item_or_end") and punctuation == "]":
+                expected = "after_list"
+            elif expected == "after_list" and punctuation == ",":
+                expected = "key"
+            elif expected in ("after_list", "key_or_end") and punctuation == "}":
+                expected = "end"
+            elif expected == "start":
+                raise invalid(f"{token} at the top level")
+            elif expected == "list":
+                raise invalid(f"{token} as the value of {current_key!r}")
+            else:
+                raise invalid(f"unexpected {token}")
+
+    if expected != "end":
+        raise invalid("an incomplete document" if expected != "start" else "an empty file")
+
+
+async def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Import deposit addresses into the pool")
+    parser.add_argument("path", nargs="?", default="deposit_addresses.json")
+    parser.add_argument("--force", action="store_true", help="import even if the file is unchanged")
+    args = parser.parse_args(argv)
+
+    # Imported here: database.db imports this module during init_db
+    from database.db import open_db, close_db, import_deposit_addresses
+
+    await open_db()
+    try:
+        await import_deposit_addresses(Path(args.path), force=args.force)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    asyncio.run(_main())
@@ -1,299 +1,350 @@
-import aiosqlite
-import json
+import asyncio
 from pathlib import Path
 from config import load_config
+from database.pool import ConnectionPool
+from database.cache import BloomFilter, TTLCache
+from database.write_queue import WriteQueue
+from database.models import (
+    AddressTransaction, Deal, DealEvent, DealStatus, FsmRecord, OutboxMessage, User, can_transition, columns,
+    select_columns, verify_schema
+)
+from database.migrations import run_migrations
+from database.address_import import file_sha256, iter_address_file
+from utils.address_validation import is_valid_address
+from utils.metrics import Counter, Histogram, instrument_module
+from utils.deal_ids import DEAL_ID_SPACE, DealIdPermutation
 from datetime import datetime, timedelta
 import logging
+import time
 
 config = load_config()
 DB_PATH = config.database_path
 logger = logging.getLogger("escrow_bot")
 
+# Shared connections, opened once by open_db() and closed by close_db()
+pool = ConnectionPool(DB_PATH, readers=config.db_reader_connections)
+
+# How long a deposit address stays reserved for an unpaid deal
+ADDRESS_RESERVATION_HOURS = 12
+
+# Extra time after the reservation for a payment sent near its end to be confirmed (some providers
+# only timestamp confirmed transactions) and for an admin to check a reported payment
+PAYMENT_GRACE_HOURS = 6
+
+# Handler writes go through one group-committing writer coroutine
+write_queue = WriteQueue(
+    pool,
+    max_batch=config.write_batch_size,
+    max_delay=config.write_batch_delay_ms / 1000
+)
+
+# Read-through user caches, one per lookup key; create_user invalidates them
+_users_by_id = TTLCache(config.user_cache_size, config.user_cache_ttl)
+_users_by_telegram_id = TTLCache(config.user_cache_size, config.user_cache_ttl)
+_users_by_username = TTLCache(config.user_cache_size, config.user_cache_ttl)
+
+# Deal IDs known to exist; built by load_deal_ids(), None until then (or when disabled)
+_deal_ids = None
+_deal_ids_rowid = 0
+_deal_id_rejections = 0
+
+# Deal ID allocation: a block of counter values reserved in app_meta, handed out one at a time
+_deal_id_lock = asyncio.Lock()
+_deal_id_permutation = None
+_deal_id_legacy_rowid = 0
+_deal_id_next = 0
+_deal_id_end = 0
+
+# Explicit column lists keep row layout fixed, so rows map onto models positionally
+USER_SELECT = select_columns(User)
+DEAL_SELECT = select_columns(Deal)
+DEAL_EVENT_SELECT = select_columns(DealEvent)
+ADDRESS_TX_SELECT = select_columns(AddressTransaction)
+FSM_SELECT = select_columns(FsmRecord)
+OUTBOX_SELECT = select_columns(OutboxMessage)
+USER_WIDTH = len(columns(User))
+DEAL_WIDTH = len(columns(Deal))
+
+# Every public coroutine in this module is timed, see instrument_module() at the bottom
+DB_QUERY_SECONDS = Histogram("escrow_db_query_seconds", "Duration of database.db calls", ("function",))
+DB_QUERY_ERRORS = Counter("escrow_db_query_errors_total", "Exceptions raised by database.db calls", ("function",))
+
+# Rows per executemany() call when importing the address pool
+ADDRESS_IMPORT_BATCH_SIZE = 5000
+
+async def open_db() -> int:
+    """Opens the connection pool and brings the schema up to date"""
+    await pool.open()
+    async with pool.writer() as db:
+        schema_version = await run_migrations(db)
+        await verify_schema(db)
+    write_queue.start()
+    await load_deal_ids()
+    return schema_version
+
 async def init_db():
-    """Creates or updates SQLite database"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Create deposit_addresses table
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS deposit_addresses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            crypto_type TEXT NOT NULL CHECK(crypto_type IN ('BTC', 'LTC')),
-            address TEXT UNIQUE NOT NULL,
-            is_used BOOLEAN DEFAULT 0,
-            reserved_until TIMESTAMP NULL
-        )
-        """)
-        
-        # Create users table
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_id INTEGER UNIQUE NOT NULL,
-            username TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-        
-        # Create admins table
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS admins (
-            telegram_id INTEGER PRIMARY KEY
-        )
-        """)
-        
-        # Check and update deals table structure
-        try:
-            # Check current table structure
-            cursor = await db.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='deals'")
-            table_info = await cursor.fetchone()
-            
-            if table_info:
-                table_sql = table_info[0]
-                # Check current description constraint
-                if "LENGTH(description) <= 100" in table_sql:
-                    logger.info("🔄 Found old description length constraint (100 characters). Updating to 200...")
-                    
-                    # Create temporary table
-                    await db.execute("""
-                    CREATE TABLE deals_temp (
-                        id TEXT PRIMARY KEY,
-                        buyer_id INTEGER NOT NULL,
-                        seller_id INTEGER NOT NULL,
-                        crypto_type TEXT CHECK(crypto_type IN ('BTC', 'LTC')),
-                        original_amount REAL NOT NULL,
-                        amount REAL NOT NULL,
-                        description TEXT CHECK(LENGTH(description) <= 200),
-                        status TEXT DEFAULT 'CREATED',
-                        deposit_address TEXT NOT NULL,
-                        tx_hash TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                    """)
-                    
-                    # Copy data
-                    await db.execute("""
-                    INSERT INTO deals_temp
-                    SELECT id, buyer_id, 
-                           (SELECT id FROM users WHERE username = seller_username LIMIT 1),
-                           crypto_type, amount, amount, description, status, deposit_address, tx_hash, 
-                           created_at, updated_at
-                    FROM deals
-                    """)
-                    
-                    # Drop old table
-                    await db.execute("DROP TABLE deals")
-                    
-                    # Rename temporary table
-                    await db.execute("ALTER TABLE deals_temp RENAME TO deals")
-                    
-                    logger.info("✅ Deals table structure successfully updated to 200 characters")
-                elif "seller_id" not in table_sql:
-                    logger.warning("⚠️ No seller_id field. Updating structure...")
-                    
-                    # Create temporary table with new structure
-                    await db.execute("""
-                    CREATE TABLE deals_temp (
-                        id TEXT PRIMARY KEY,
-                        buyer_id INTEGER NOT NULL,
-                        seller_id INTEGER NOT NULL,
-                        crypto_type TEXT CHECK(crypto_type IN ('BTC', 'LTC')),
-                        original_amount REAL NOT NULL,
-                        amount REAL NOT NULL,
-                        description TEXT CHECK(LENGTH(description) <= 200),
-                        status TEXT DEFAULT 'CREATED',
-                        deposit_address TEXT NOT NULL,
-                        tx_hash TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                    """)
-                    
-                    # Copy data
-                    await db.execute("""
-                    INSERT INTO deals_temp
-                    SELECT id, buyer_id, 
-                           (SELECT id FROM users WHERE username = seller_username LIMIT 1),
-                           crypto_type, amount, amount, description, status, deposit_address, tx_hash, 
-                           created_at, updated_at
-                    FROM deals
-                    """)
-                    
-                    # Drop old table
-                    await db.execute("DROP TABLE deals")
-                    
-                    # Rename temporary table
-                    await db.execute("ALTER TABLE deals_temp RENAME TO deals")
-                    
-                    logger.info("✅ Added seller_id field to deals table structure")
-            else:
-                # Table doesn't exist, create new one with correct structure
-                await db.execute("""
-                CREATE TABLE deals (
-                    id TEXT PRIMARY KEY,
-                    buyer_id INTEGER NOT NULL,
-                    seller_id INTEGER NOT NULL,
-                    crypto_type TEXT CHECK(crypto_type IN ('BTC', 'LTC')),
-                    original_amount REAL NOT NULL,
-                    amount REAL NOT NULL,
-                    description TEXT CHECK(LENGTH(description) <= 200),
-                    status TEXT DEFAULT 'CREATED',
-                    deposit_address TEXT NOT NULL,
-                    tx_hash TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-                logger.info("✅ Created new deals table with 200 character constraint")
-        
-        except Exception as e:
-            logger.error(f"❌ Error checking/updating deals table structure: {str(e)}")
-            # Create table with correct structure as last resort
-            await db.execute("DROP TABLE IF EXISTS deals")
-            await db.execute("""
-            CREATE TABLE deals (
-                id TEXT PRIMARY KEY,
-                buyer_id INTEGER NOT NULL,
-                seller_id INTEGER NOT NULL,
-                crypto_type TEXT CHECK(crypto_type IN ('BTC', 'LTC')),
-                original_amount REAL NOT NULL,
-                amount REAL NOT NULL,
-                description TEXT CHECK(LENGTH(description) <= 200),
-                status TEXT DEFAULT 'CREATED',
-                deposit_address TEXT NOT NULL,
-                tx_hash TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-            logger.info("✅ Deals table recreated with correct structure")
-        
-        # Load address pool from JSON
-        addresses_file = Path("deposit_addresses.json")
-        if addresses_file.exists():
-            with open(addresses_file) as f:
-                addresses = json.load(f)
-            
-            for crypto, addr_list in addresses.items():
-                # Ensure we only add BTC and LTC
-                if crypto in ["BTC", "LTC"]:
-                    for addr in addr_list:
-                        await db.execute(
-                            "INSERT OR IGNORE INTO deposit_addresses (crypto_type, address) VALUES (?, ?)",
-                            (crypto, addr)
-                        )
-        
+    """Opens the database, loads the address pool and registers admins"""
+    started = time.perf_counter()
+    
+    schema_version = await open_db()
+    
+    # Load address pool from JSON (skipped when the file is unchanged)
+    await import_deposit_addresses(Path("deposit_addresses.json"))
+    
+    async with pool.writer() as db:
         # Add admins
         for admin_id in config.admin_telegram_ids:
             await db.execute(
                 "INSERT OR IGNORE INTO admins (telegram_id) VALUES (?)",
                 (admin_id,)
             )
+    
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"✅ Database successfully initialized (schema v{schema_version}, {elapsed_ms:.1f} ms)")
+
+async def import_deposit_addresses(path: Path, force: bool = False) -> int:
+    """Bulk-loads a deposit address file, skipping it if its content hash is already recorded"""
+    if not path.exists():
+        return 0
+    
+    meta_key = f"address_import_sha256:{path.name}"
+    content_hash = await asyncio.to_thread(file_sha256, path)
+    
+    async with pool.reader() as db:
+        cursor = await db.execute("SELECT value FROM app_meta WHERE key = ?", (meta_key,))
+        row = await cursor.fetchone()
+    
+    if row and row[0] == content_hash and not force:
+        logger.info(f"ℹ️ {path} unchanged since last import, skipping")
+        return 0
+    
+    started = time.perf_counter()
+    total = inserted = invalid = 0
+    
+    async with pool.writer() as db:
+        async def flush(batch):
+            cursor = await db.executemany(
+                "INSERT OR IGNORE INTO deposit_addresses (crypto_type, address) VALUES (?, ?)",
+                batch
+            )
+            return cursor.rowcount
         
-        await db.commit()
-        logger.info("✅ Database successfully initialized")
-
-async def release_expired_addresses():
-    """Releases addresses reserved more than 12 hours ago"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        current_time = datetime.utcnow()
-        expired_time = current_time - timedelta(hours=12)
+        batch = []
+        for crypto, address in iter_address_file(path):
+            total += 1
+            # Ensure we only add valid BTC and LTC addresses
+            if not is_valid_address(crypto, address):
+                invalid += 1
+                if invalid <= 10:
+                    logger.warning(f"⚠️ Skipping invalid {crypto} address: {address}")
+                continue
+            
+            batch.append((crypto, address))
+            if len(batch) >= ADDRESS_IMPORT_BATCH_SIZE:
+                inserted += await flush(batch)
+                batch = []
         
-        # Update addresses with expired reservation time
-        await db.execute("""
+        if batch:
+            inserted += await flush(batch)
+        
+        await db.execute(
+            "INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)",
+            (meta_key, content_hash)
+        )
+    
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"✅ Imported {path}: {inserted} new, {total - inserted - invalid} already present, "
+        f"{invalid} invalid ({elapsed_ms:.1f} ms)"
+    )
+    return inserted
+
+async def close_db():
+    """Flushes queued writes and closes the connection pool"""
+    await write_queue.stop()
+    await pool.close()
+
+async def release_expired_addresses() -> list:
+    """Releases addresses whose reservation has expired and cancels the unpaid deals holding them.
+    
+    An address is released PAYMENT_GRACE_HOURS after its reservation ends, unless a transaction
+    was seen in the deal's payment window (see deal_payment_window). Deals whose buyer reported
+    a payment (PAID_WAITING_ADMIN) but no transaction showed up are cancelled as well.
+    Returns the cancelled deals.
+    """
+    async with pool.writer() as db:
+        grace_time = datetime.utcnow() - timedelta(hours=PAYMENT_GRACE_HOURS)
+        
+        # Addresses of paid deals and of deals whose payment is already on its way are kept
+        cursor = await db.execute(f"""
         UPDATE deposit_addresses
         SET is_used = 0, reserved_until = NULL
-        WHERE reserved_until IS NOT NULL AND reserved_until < ?
-        AND address NOT IN (
-            SELECT deposit_address FROM deals 
-            WHERE status IN ('PAID', 'SHIPPED', 'COMPLETED')
+        WHERE is_used = 1 AND reserved_until IS NOT NULL AND reserved_until < ?
+        AND NOT EXISTS (
+            SELECT 1 FROM deals
+            WHERE deals.deposit_address = deposit_addresses.address
+            AND deals.status IN ('PAID', 'SHIPPED', 'COMPLETED')
         )
-        """, (expired_time,))
+        AND NOT EXISTS (
+            SELECT 1 FROM address_transactions
+            WHERE address_transactions.address = deposit_addresses.address
+            AND address_transactions.seen_at >= datetime(
+                deposit_addresses.reserved_until, '-{ADDRESS_RESERVATION_HOURS} hours'
+            )
+            AND address_transactions.seen_at < datetime(
+                deposit_addresses.reserved_until, '+{PAYMENT_GRACE_HOURS} hours'
+            )
+        )
+        RETURNING address
+        """, (grace_time,))
+        released = [row[0] for row in await cursor.fetchall()]
         
-        rows_affected = db.total_changes
-        if rows_affected > 0:
-            logger.info(f"✅ Released {rows_affected} addresses with expired reservation")
+        # The address can go to a new deal now, so the old one must stop waiting for payment on it
+        cancelled = []
+        for address in released:
+            cursor = await db.execute(
+                f"SELECT {DEAL_SELECT} FROM deals WHERE deposit_address = ? AND status IN (?, ?, ?)",
+                (address, DealStatus.CREATED, DealStatus.AWAITING_PAYMENT, DealStatus.PAID_WAITING_ADMIN)
+            )
+            for deal in [Deal(*row) for row in await cursor.fetchall()]:
+                await db.execute(
+                    "UPDATE deals SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?",
+                    (DealStatus.CANCELLED, deal.id, deal.status)
+                )
+                await _record_deal_event(db, deal.id, deal.status, DealStatus.CANCELLED)
+                cancelled.append(deal)
         
-        await db.commit()
+        if released:
+            logger.info(
+                f"✅ Released {len(released)} addresses with expired reservation, "
+                f"cancelled {len(cancelled)} unpaid deals"
+            )
+        return cancelled
+
+def deal_payment_window(deal: Deal) -> tuple:
+    """(since, until): seen times of transactions that can pay the deal.
+    
+    That is while its address was reserved plus PAYMENT_GRACE_HOURS, since a provider may only
+    timestamp a payment sent near the end of the reservation once it is confirmed.
+    """
+    created_at = datetime.fromisoformat(deal.created_at)
+    until = created_at + timedelta(hours=ADDRESS_RESERVATION_HOURS + PAYMENT_GRACE_HOURS)
+    return deal.created_at, until.strftime("%Y-%m-%d %H:%M:%S")
 
 async def get_next_deposit_address(crypto_type: str) -> str:
-    """Returns a free address from the pool (with automatic release)"""
+    """Atomically reserves a free address from the pool"""
     # Check allowed cryptocurrency types
     if crypto_type not in ["BTC", "LTC"]:
         raise ValueError("Only BTC and LTC are allowed")
     
-    # First release expired addresses
-    await release_expired_addresses()
+    reserved_until = datetime.utcnow() + timedelta(hours=ADDRESS_RESERVATION_HOURS)
     
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Get address with earliest reservation time
+    async def reserve(db):
+        # Pick and reserve in one statement so an address is never handed out twice
         cursor = await db.execute(
             """
-            SELECT address FROM deposit_addresses 
-            WHERE crypto_type = ? AND (
-                is_used = 0 OR 
-                reserved_until < datetime('now')
+            UPDATE deposit_addresses
+            SET is_used = 1, reserved_until = ?
+            WHERE id = (
+                SELECT id FROM deposit_addresses
+                WHERE crypto_type = ? AND is_used = 0
+                LIMIT 1
             )
-            ORDER BY 
-                CASE WHEN is_used = 0 THEN 0 ELSE 1 END,
-                reserved_until ASC
-            LIMIT 1
+            RETURNING address
             """,
-            (crypto_type,)
+            (reserved_until, crypto_type)
         )
         row = await cursor.fetchone()
+        await cursor.close()
         
         if not row:
             raise ValueError(f"No free addresses for {crypto_type}. Contact administrator.")
         
-        address = row[0]
-        
-        # Update status and set reservation time
-        reserved_until = datetime.utcnow() + timedelta(hours=12)
-        await db.execute(
-            """
-            UPDATE deposit_addresses 
-            SET is_used = 1, reserved_until = ? 
-            WHERE address = ?
-            """,
-            (reserved_until, address)
-        )
-        await db.commit()
-        return address
+        return row[0]
+    
+    return await write_queue.submit(reserve)
 
 async def create_user(telegram_id: int, username: str):
     """Creates a user in the database"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async def insert(db):
         await db.execute(
             "INSERT OR IGNORE INTO users (telegram_id, username) VALUES (?, ?)",
             (telegram_id, username)
         )
-        await db.commit()
+    
+    await write_queue.submit(insert)
+    _invalidate_user(telegram_id, username)
 
-async def get_user_by_username(username: str) -> dict:
-    """Gets a user by username"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(
-            "SELECT * FROM users WHERE username = ?",
-            (username,)
-        )
-        row = await cursor.fetchone()
-        if row:
-            columns = [desc[0] for desc in cursor.description]
-            return dict(zip(columns, row))
-        return None
+def _cache_user(user: User):
+    _users_by_id.set(user.id, user)
+    _users_by_telegram_id.set(user.telegram_id, user)
+    if user.username:
+        _users_by_username.set(user.username, user)
 
-async def get_user_by_id(user_id: int) -> dict:
-    """Gets a user by ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(
-            "SELECT * FROM users WHERE id = ? OR telegram_id = ?",
-            (user_id, user_id)
-        )
+def _invalidate_user(telegram_id: int, username: str):
+    cached = _users_by_telegram_id.pop(telegram_id)
+    if cached:
+        _users_by_id.pop(cached.id)
+        _users_by_username.pop(cached.username)
+    _users_by_username.pop(username)
+
+async def _fetch_user(where: str, value) -> User:
+    async with pool.reader() as db:
+        cursor = await db.execute(f"SELECT {USER_SELECT} FROM users WHERE {where} = ?", (value,))
         row = await cursor.fetchone()
-        if row:
-            columns = [desc[0] for desc in cursor.description]
-            return dict(zip(columns, row))
+    
+    if not row:
         return None
+    user = User(*row)
+    _cache_user(user)
+    return user
+
+async def get_user_by_username(username: str) -> User:
+    """Gets a user by username"""
+    return _users_by_username.get(username) or await _fetch_user("username", username)
+
+async def get_user_by_internal_id(user_id: int) -> User:
+    """Gets a user by internal ID (users.id, as stored in deals)"""
+    return _users_by_id.get(user_id) or await _fetch_user("id", user_id)
+
+async def get_user_by_telegram_id(telegram_id: int) -> User:
+    """Gets a user by Telegram ID"""
+    return _users_by_telegram_id.get(telegram_id) or await _fetch_user("telegram_id", telegram_id)
+
+async def get_users_by_ids(user_ids: list) -> dict:
+    """Gets several users by internal ID in one query, returns {id: User}"""
+    users = {}
+    missing = []
+    for user_id in set(user_ids):
+        user = _users_by_id.get(user_id)
+        if user:
+            users[user_id] = user
+        else:
+            missing.append(user_id)
+    
+    if missing:
+        placeholders = ", ".join("?" for _ in missing)
+        async with pool.reader() as db:
+            cursor = await db.execute(
+                f"SELECT {USER_SELECT} FROM users WHERE id IN ({placeholders})",
+                missing
+            )
+            rows = await cursor.fetchall()
+        
+        for row in rows:
+            user = User(*row)
+            _cache_user(user)
+            users[user.id] = user
+    
+    return users
+
+def user_cache_stats() -> dict:
+    """Hit/miss counters and sizes of the user caches"""
+    return {
+        "by_id": _users_by_id.stats(),
+        "by_telegram_id": _users_by_telegram_id.stats(),
+        "by_username": _users_by_username.stats(),
+    }
 
 async def create_deal(deal_data: dict):
     """Creates a new deal"""
@@ -301,7 +352,7 @@ async def create_deal(deal_data: dict):
     if deal_data["crypto_type"] not in ["BTC", "LTC"]:
         raise ValueError("Only BTC and LTC are allowed")
     
-    async with aiosqlite.connect(DB_PATH) as db:
+    async def insert(db):
         await db.execute("""
         INSERT INTO deals (
             id, buyer_id, seller_id, crypto_type, original_amount, amount,
@@ -318,35 +369,379 @@ async def create_deal(deal_data: dict):
             deal_data["deposit_address"],
             deal_data["status"]
         ))
-        await db.commit()
+        await _record_deal_event(db, deal_data["id"], None, deal_data["status"])
+    
+    # Added before the insert: a false positive for a moment is harmless, a false negative is not
+    if _deal_ids is not None:
+        _deal_ids.add(deal_data["id"])
+    await write_queue.submit(insert)
+
+async def _record_deal_event(db, deal_id: str, from_status: str, to_status: str, tx_hash: str = None):
+    # Runs inside the caller's write operation, so it commits together with the change
+    await db.execute(
+        "INSERT INTO deal_events (deal_id, from_status, to_status, tx_hash) VALUES (?, ?, ?, ?)",
+        (deal_id, from_status, to_status, tx_hash)
+    )
+
+async def load_deal_ids():
+    """Builds the deal ID filter from the deals table"""
+    global _deal_ids, _deal_ids_rowid
+    if not config.deal_id_filter_capacity:
+        return
+    
+    async with pool.reader() as db:
+        cursor = await db.execute("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM deals")
+        total, max_rowid = await cursor.fetchone()
+        deal_ids = BloomFilter(max(config.deal_id_filter_capacity, total * 2), config.deal_id_filter_error_rate)
+        cursor = await db.execute("SELECT id FROM deals WHERE rowid <= ?", (max_rowid,))
+        async for (deal_id,) in cursor:
+            deal_ids.add(deal_id)
+    
+    _deal_ids, _deal_ids_rowid = deal_ids, max_rowid
+    logger.info(f"✅ Deal ID filter loaded: {total} deals, {deal_ids.stats()['bytes'] // 1024} KiB")
+
+async def refresh_deal_ids():
+    """Adds deals inserted since the last load or refresh, e.g. by another bot process"""
+    global _deal_ids_rowid
+    if _deal_ids is None:
+        return
+    
+    async with pool.reader() as db:
+        cursor = await db.execute("SELECT rowid, id FROM deals WHERE rowid > ? ORDER BY rowid", (_deal_ids_rowid,))
+        rows = await cursor.fetchall()
+    for rowid, deal_id in rows:
+        _deal_ids.add(deal_id)
+        _deal_ids_rowid = rowid
+
+def deal_may_exist(deal_id: str) -> bool:
+    """False only for IDs that had no deal at the last load or refresh.
+    
+    Meant for IDs typed by users; deals made by other processes may be missing until the next refresh.
+    """
+    global _deal_id_rejections
+    if _deal_ids is None or deal_id in _deal_ids:
+        return True
+    _deal_id_rejections += 1
+    return False
+
+def deal_id_filter_stats() -> dict:
+    if _deal_ids is None:
+        return {}
+    return {**_deal_ids.stats(), "rejected": _deal_id_rejections}
+
+async def _reserve_deal_id_block():
+    global _deal_id_permutation, _deal_id_legacy_rowid, _deal_id_next, _deal_id_end
+    size = max(1, config.deal_id_block_size)
+    
+    async def reserve(db):
+        # Other bot processes share the counter, so their blocks never overlap ours
+        cursor = await db.execute(
+            """
+            UPDATE app_meta SET value = CAST(value AS INTEGER) + ?
+            WHERE key = 'deal_id_next'
+            RETURNING CAST(value AS INTEGER)
+            """,
+            (size,)
+        )
+        (end,) = await cursor.fetchone()
+        await cursor.close()
+        cursor = await db.execute(
+            "SELECT key, value FROM app_meta WHERE key IN ('deal_id_key', 'deal_id_legacy_rowid')"
+        )
+        return end, dict(await cursor.fetchall())
+    
+    end, meta = await write_queue.submit(reserve)
+    if end - size >= DEAL_ID_SPACE:
+        raise RuntimeError("Deal ID space exhausted")
+    
+    if _deal_id_permutation is None:
+        _deal_id_permutation = DealIdPermutation(bytes.fromhex(meta["deal_id_key"]))
+        _deal_id_legacy_rowid = int(meta["deal_id_legacy_rowid"])
+    _deal_id_next, _deal_id_end = end - size, min(end, DEAL_ID_SPACE)
+
+async def _is_legacy_deal_id(deal_id: str) -> bool:
+    """Whether a deal made before the allocator (with a random ID) already uses this ID"""
+    if not _deal_id_legacy_rowid:
+        return False
+    if _deal_ids is not None and deal_id not in _deal_ids:
+        return False
+    
+    async with pool.reader() as db:
+        cursor = await db.execute(
+            "SELECT 1 FROM deals WHERE id = ? AND rowid <= ?",
+            (deal_id, _deal_id_legacy_rowid)
+        )
+        return bool(await cursor.fetchone())
+
+async def allocate_deal_id() -> str:
+    """Hands out a deal ID no other deal has; the database is only touched once per block of IDs"""
+    global _deal_id_next
+    async with _deal_id_lock:
+        while True:
+            if _deal_id_next >= _deal_id_end:
+                await _reserve_deal_id_block()
+            deal_id = _deal_id_permutation.encode(_deal_id_next)
+            _deal_id_next += 1
+            if not await _is_legacy_deal_id(deal_id):
+                return deal_id
 
-async def get_deal_by_id(deal_id: str) -> dict:
+async def get_deal_by_id(deal_id: str) -> Deal:
     """Gets a deal by ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.reader() as db:
         cursor = await db.execute(
-            "SELECT * FROM deals WHERE id = ?",
+            f"SELECT {DEAL_SELECT} FROM deals WHERE id = ?",
             (deal_id,)
         )
         row = await cursor.fetchone()
-        if row:
-            columns = [desc[0] for desc in cursor.description]
-            return dict(zip(columns, row))
-        return None
+    return Deal(*row) if row else None
+
+async def get_deal_with_participants(deal_id: str) -> tuple:
+    """Gets a deal with its buyer and seller in one query, returns (deal, buyer, seller)"""
+    async with pool.reader() as db:
+        cursor = await db.execute(
+            f"""
+            SELECT {select_columns(Deal, "deals")},
+                   {select_columns(User, "buyer")},
+                   {select_columns(User, "seller")}
+            FROM deals
+            LEFT JOIN users AS buyer ON buyer.id = deals.buyer_id
+            LEFT JOIN users AS seller ON seller.id = deals.seller_id
+            WHERE deals.id = ?
+            """,
+            (deal_id,)
+        )
+        row = await cursor.fetchone()
+    
+    if not row:
+        return None, None, None
+    
+    deal = Deal(*row[:DEAL_WIDTH])
+    participants = []
+    for offset in (DEAL_WIDTH, DEAL_WIDTH + USER_WIDTH):
+        user_row = row[offset:offset + USER_WIDTH]
+        # LEFT JOIN yields NULLs when the user is missing
+        user = User(*user_row) if user_row[0] is not None else None
+        if user:
+            _cache_user(user)
+        participants.append(user)
+    
+    return deal, participants[0], participants[1]
+
+async def get_deal_events(deal_id: str) -> list:
+    """Gets the status history of a deal, oldest first"""
+    async with pool.reader() as db:
+        cursor = await db.execute(
+            f"SELECT {DEAL_EVENT_SELECT} FROM deal_events WHERE deal_id = ? ORDER BY id",
+            (deal_id,)
+        )
+        rows = await cursor.fetchall()
+    return [DealEvent(*row) for row in rows]
+
+async def get_user_deals_page(user_id: int, cursor_deal_id: str = None, direction: str = "next", limit: int = 5) -> tuple:
+    """Keyset page of a user's deals (as buyer or seller), newest first.
+    
+    The page starts after (direction="next") or before (direction="prev") cursor_deal_id.
+    Returns (deals, has_more), where has_more tells whether further pages exist in that direction.
+    """
+    if direction == "next":
+        comparison, order = "<", "DESC"
+    else:
+        comparison, order = ">", "ASC"
+    
+    keyset = ""
+    params = {"user_id": user_id, "limit": limit + 1}
+    if cursor_deal_id:
+        keyset = f"AND (created_at, id) {comparison} (SELECT created_at, id FROM deals WHERE id = :cursor)"
+        params["cursor"] = cursor_deal_id
+    
+    # Each branch walks its own (participant, created_at, id) index
+    query = f"""
+    SELECT * FROM (
+        SELECT {DEAL_SELECT} FROM deals
+        WHERE buyer_id = :user_id {keyset}
+        ORDER BY created_at {order}, id {order} LIMIT :limit
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT {DEAL_SELECT} FROM deals
+        WHERE seller_id = :user_id AND buyer_id != :user_id {keyset}
+        ORDER BY created_at {order}, id {order} LIMIT :limit
+    )
+    ORDER BY created_at {order}, id {order} LIMIT :limit
+    """
+    async with pool.reader() as db:
+        cursor = await db.execute(query, params)
+        rows = await cursor.fetchall()
+    
+    deals = [Deal(*row) for row in rows[:limit]]
+    if direction != "next":
+        deals.reverse()
+    return deals, len(rows) > limit
 
-async def update_deal_status(deal_id: str, new_status: str, tx_hash: str = None):
-    """Updates deal status and update time"""
-    async with aiosqlite.connect(DB_PATH) as db:
+async def get_deals_by_status(statuses: tuple) -> list:
+    """Gets all deals currently in one of the given statuses"""
+    placeholders = ", ".join("?" for _ in statuses)
+    async with pool.reader() as db:
+        cursor = await db.execute(
+            f"SELECT {DEAL_SELECT} FROM deals WHERE status IN ({placeholders})",
+            tuple(statuses)
+        )
+        rows = await cursor.fetchall()
+    return [Deal(*row) for row in rows]
+
+async def update_deal_status(deal_id: str, new_status: str, expected_status: str, tx_hash: str = None) -> bool:
+    """Moves a deal from expected_status to new_status; False if the deal was not in expected_status"""
+    if not can_transition(expected_status, new_status):
+        logger.warning(f"⚠️ Deal {deal_id}: transition {expected_status} → {new_status} is not allowed")
+        return False
+    
+    async def update(db):
         if tx_hash:
-            await db.execute(
-                "UPDATE deals SET status = ?, tx_hash = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (new_status, tx_hash, deal_id)
+            # One payment settles one escrow, even if its address was reused by a later deal
+            cursor = await db.execute("SELECT id FROM deals WHERE tx_hash = ? AND id != ? LIMIT 1", (tx_hash, deal_id))
+            other = await cursor.fetchone()
+            if other:
+                logger.warning(f"⚠️ Deal {deal_id}: transaction {tx_hash} already settled deal {other[0]}")
+                return False
+        
+        # Compare-and-set: only one of several concurrent callers can apply the transition
+        if tx_hash:
+            cursor = await db.execute(
+                "UPDATE deals SET status = ?, tx_hash = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?",
+                (new_status, tx_hash, deal_id, expected_status)
             )
         else:
-            await db.execute(
-                "UPDATE deals SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (new_status, deal_id)
+            cursor = await db.execute(
+                "UPDATE deals SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?",
+                (new_status, deal_id, expected_status)
+            )
+        if cursor.rowcount != 1:
+            return False
+        await _record_deal_event(db, deal_id, expected_status, new_status, tx_hash)
+        return True
+    
+    return await write_queue.submit(update)
+
+async def get_scanned_height(address: str) -> int:
+    """Block height up to which the address's transactions are final and in the ledger"""
+    async with pool.reader() as db:
+        cursor = await db.execute("SELECT scanned_height FROM deposit_addresses WHERE address = ?", (address,))
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+async def record_address_scan(crypto_type: str, address: str, txs: list, scanned_height: int):
+    """Upserts scanned transactions into the ledger and moves the address's cursor forward"""
+    async def record(db):
+        if txs:
+            # Providers may disagree on a tx's amount; the ledger keeps the lower one
+            await db.executemany("""
+            INSERT INTO address_transactions (
+                crypto_type, address, tx_hash, value, confirmations, block_height, seen_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (crypto_type, address, tx_hash) DO UPDATE SET
+                value = MIN(value, excluded.value),
+                confirmations = excluded.confirmations,
+                block_height = excluded.block_height,
+                seen_at = MIN(seen_at, excluded.seen_at)
+            """, [
+                (crypto_type, address, tx.tx_hash, tx.value, tx.confirmations, tx.block_height, tx.seen_at)
+                for tx in txs
+            ])
+        await db.execute(
+            "UPDATE deposit_addresses SET scanned_height = ? WHERE address = ? AND scanned_height < ?",
+            (scanned_height, address, scanned_height)
+        )
+    
+    await write_queue.submit(record)
+
+async def get_address_hooks() -> dict:
+    """Registered provider webhooks as {address: (crypto_type, hook_id)}"""
+    async with pool.reader() as db:
+        cursor = await db.execute(
+            "SELECT address, crypto_type, hook_id FROM deposit_addresses WHERE hook_id IS NOT NULL"
+        )
+        rows = await cursor.fetchall()
+    return {address: (crypto_type, hook_id) for address, crypto_type, hook_id in rows}
+
+async def set_address_hook(address: str, hook_id: str = None):
+    """Stores (or with None clears) the webhook registered for an address"""
+    async def update(db):
+        await db.execute("UPDATE deposit_addresses SET hook_id = ? WHERE address = ?", (hook_id, address))
+    
+    await write_queue.submit(update)
+
+async def get_address_transactions(crypto_type: str, address: str, since: str = None, until: str = None) -> list:
+    """Ledger transactions of an address, optionally only those first seen in [`since`, `until`)"""
+    query = f"SELECT {ADDRESS_TX_SELECT} FROM address_transactions WHERE crypto_type = ? AND address = ?"
+    params = [crypto_type, address]
+    if since:
+        query += " AND seen_at >= ?"
+        params.append(since)
+    if until:
+        query += " AND seen_at < ?"
+        params.append(until)
+    # Unconfirmed first, then newest block first
+    query += " ORDER BY block_height < 0 DESC, block_height DESC"
+    
+    async with pool.reader() as db:
+        cursor = await db.execute(query, params)
+        rows = await cursor.fetchall()
+    return [AddressTransaction(*row) for row in rows]
+
+async def get_fsm_record(key: str) -> FsmRecord:
+    async with pool.reader() as db:
+        cursor = await db.execute(f"SELECT {FSM_SELECT} FROM fsm_states WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+    return FsmRecord(*row) if row else None
+
+async def save_fsm_records(records: list, deleted_keys: list):
+    """Upserts changed conversations and removes finished ones in one transaction"""
+    async def save(db):
+        if records:
+            await db.executemany(
+                """
+                INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                """,
+                [(record.key, record.state, record.data, record.updated_at) for record in records]
             )
-        await db.commit()
+        if deleted_keys:
+            await db.executemany("DELETE FROM fsm_states WHERE key = ?", [(key,) for key in deleted_keys])
+
+    await write_queue.submit(save)
+
+async def delete_expired_fsm_records(updated_before: float) -> int:
+    """Drops conversations idle since before `updated_before` (unix time); returns how many"""
+    async def delete(db):
+        cursor = await db.execute("DELETE FROM fsm_states WHERE updated_at < ?", (updated_before,))
+        return cursor.rowcount
+
+    return await write_queue.submit(delete)
+
+async def add_outbox_message(chat_id: int, payload: str) -> int:
+    """Stores an outgoing message until it is delivered; returns its id"""
+    async def insert(db):
+        cursor = await db.execute(
+            "INSERT INTO outbox_messages (chat_id, payload) VALUES (?, ?)",
+            (chat_id, payload)
+        )
+        return cursor.lastrowid
+
+    return await write_queue.submit(insert)
+
+async def delete_outbox_message(message_id: int):
+    async def delete(db):
+        await db.execute("DELETE FROM outbox_messages WHERE id = ?", (message_id,))
+
+    await write_queue.submit(delete)
+
+async def get_outbox_messages() -> list:
+    """Undelivered messages, oldest first"""
+    async with pool.reader() as db:
+        cursor = await db.execute(f"SELECT {OUTBOX_SELECT} FROM outbox_messages ORDER BY id")
+        rows = await cursor.fetchall()
+    return [OutboxMessage(*row) for row in rows]
 
 async def has_available_addresses(crypto_type: str) -> bool:
     """Checks for available addresses"""
@@ -354,9 +749,11 @@ async def has_available_addresses(crypto_type: str) -> bool:
     if crypto_type not in ["BTC", "LTC"]:
         return False
     
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.reader() as db:
         cursor = await db.execute(
             "SELECT 1 FROM deposit_addresses WHERE crypto_type = ? AND is_used = 0 LIMIT 1",
             (crypto_type,)
         )
-        return bool(await cursor.fetchone())
\ No newline at end of file
+        return bool(await cursor.fetchone())
+
+instrument_module(globals(), DB_QUERY_SECONDS, errors=DB_QUERY_ERRORS)
@@ -0,0 +1,144 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from database.db import delete_expired_fsm_records, get_fsm_record, save_fsm_records
+from database.models import FsmRecord
+
+logger = logging.getLogger("escrow_bot")
+
+EMPTY_DATA = "{}"
+
+
+@dataclass(slots=True)
+class _Conversation:
+    state: Optional[str]
+    data: str  # JSON, so a cached conversation costs one string rather than a dict tree
+    updated_at: float  # unix time of the last change, persisted
+    touched_at: float  # monotonic time of the last access, memory only
+
+
+class SQLiteStorage(BaseStorage):
+    """aiogram FSM storage on the bot database with an in-memory tier in front of it.
+
+    Changes land in memory and reach the database write-behind, when flush() group-commits
+    everything changed since the previous flush. Flushed conversations leave memory after
+    `cache_ttl` idle seconds or when more than `cache_size` are cached, and are read back on
+    their next update. expire() deletes conversations unchanged for `state_ttl` seconds.
+    """
+
+    def __init__(self, cache_size: int = 10000, cache_ttl: float = 600, state_ttl: float = 86400):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.state_ttl = state_ttl
+        self._conversations = OrderedDict()
+        self._dirty = set()
+        self._key_builder = DefaultKeyBuilder(
+            with_bot_id=True, with_business_connection_id=True, with_destiny=True
+        )
+        self.stats = {"loads": 0, "flushes": 0, "written": 0, "evicted": 0, "expired": 0}
+
+    async def _conversation(self, key: StorageKey) -> tuple:
+        storage_key = self._key_builder.build(key)
+        conversation = self._conversations.get(storage_key)
+        if conversation is None:
+            self.stats["loads"] += 1
+            record = await get_fsm_record(storage_key)
+            if record and record.updated_at >= time.time() - self.state_ttl:
+                loaded = _Conversation(record.state, record.data, record.updated_at, 0.0)
+            else:
+                # Users outside any flow are cached too, so their updates skip the database
+                loaded = _Conversation(None, EMPTY_DATA, time.time(), 0.0)
+            # A concurrent update may have cached it while we were reading
+            conversation = self._conversations.setdefault(storage_key, loaded)
+
+        self._conversations.move_to_end(storage_key)
+        conversation.touched_at = time.monotonic()
+        return storage_key, conversation
+
+    def _changed(self, storage_key: str, conversation: _Conversation):
+        conversation.updated_at = time.time()
+        self._dirty.add(storage_key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, conversation = await self._conversation(key)
+        conversation.state = state.state if isinstance(state, State) else state
+        self._changed(storage_key, conversation)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, conversation = await self._conversation(key)
+        return conversation.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        # Serialized right away so unsupported values fail in the handler, not in the flush
+        encoded = json.dumps(data) if data else EMPTY_DATA
+        storage_key, conversation = await self._conversation(key)
+        conversation.data = encoded
+        self._changed(storage_key, conversation)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, conversation = await self._conversation(key)
+        return json.loads(conversation.data)
+
+    async def flush(self):
+        """Writes changed conversations in one transaction, then evicts idle ones from memory"""
+        if self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            records, finished = [], []
+            for storage_key in dirty:
+                conversation = self._conversations[storage_key]
+                if conversation.state is None and conversation.data == EMPTY_DATA:
+                    finished.append(storage_key)
+                else:
+                    records.append(FsmRecord(
+                        storage_key, conversation.state, conversation.data, conversation.updated_at
+                    ))
+
+            try:
+                await save_fsm_records(records, finished)
+            except BaseException:
+                # Retried on the next flush
+                self._dirty |= dirty
+                raise
+            self.stats["flushes"] += 1
+            self.stats["written"] += len(dirty)
+
+        self._evict()
+
+    def _evict(self):
+        idle_since = time.monotonic() - self.cache_ttl
+        # Least recently used first
+        for storage_key in list(self._conversations):
+            conversation = self._conversations[storage_key]
+            if len(self._conversations) <= self.cache_size and conversation.touched_at >= idle_since:
+                break
+            if storage_key in self._dirty:
+                continue
+            del self._conversations[storage_key]
+            self.stats["evicted"] += 1
+
+    async def expire(self):
+        """Deletes conversations abandoned for longer than `state_ttl`"""
+        updated_before = time.time() - self.state_ttl
+        for storage_key in list(self._conversations):
+            conversation = self._conversations[storage_key]
+            if conversation.updated_at < updated_before and storage_key not in self._dirty:
+                del self._conversations[storage_key]
+
+        expired = await delete_expired_fsm_records(updated_before)
+        self.stats["expired"] += expired
+        if expired:
+            logger.info(f"🧹 Expired {expired} abandoned conversations")
+
+    async def close(self) -> None:
+        """Flushes pending changes; the database itself is closed by close_db()"""
+        await self.flush()
+
+    def cache_stats(self) -> dict:
+        return {**self.stats, "cached": len(self._conversations), "dirty": len(self._dirty)}
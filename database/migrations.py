@@ -0,0 +1,261 @@
+import logging
+import secrets
+import time
+
+logger = logging.getLogger("escrow_bot")
+
+DEALS_TABLE_SQL = """
+CREATE TABLE {name} (
+    id TEXT PRIMARY KEY,
+    buyer_id INTEGER NOT NULL,
+    seller_id INTEGER NOT NULL,
+    crypto_type TEXT CHECK(crypto_type IN ('BTC', 'LTC')),
+    original_amount REAL NOT NULL,
+    amount REAL NOT NULL,
+    description TEXT CHECK(LENGTH(description) <= 200),
+    status TEXT DEFAULT 'CREATED',
+    deposit_address TEXT NOT NULL,
+    tx_hash TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+async def _table_columns(db, table: str) -> list:
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in await cursor.fetchall()]
+
+
+async def _create_base_schema(db):
+    """Base tables; upgrades unversioned deals tables that still use seller_username"""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS deposit_addresses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        crypto_type TEXT NOT NULL CHECK(crypto_type IN ('BTC', 'LTC')),
+        address TEXT UNIQUE NOT NULL,
+        is_used BOOLEAN DEFAULT 0,
+        reserved_until TIMESTAMP NULL
+    )
+    """)
+
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id INTEGER UNIQUE NOT NULL,
+        username TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS admins (
+        telegram_id INTEGER PRIMARY KEY
+    )
+    """)
+
+    columns = await _table_columns(db, "deals")
+    if not columns:
+        await db.execute(DEALS_TABLE_SQL.format(name="deals"))
+    elif "seller_id" not in columns:
+        # Legacy layout (seller_username, 100 character description)
+        logger.info("🔄 Converting legacy deals table (seller_username → seller_id)...")
+        await db.execute(DEALS_TABLE_SQL.format(name="deals_new"))
+        # Without it the seller lookup below scans users once per deal
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)")
+        await db.execute("""
+        INSERT INTO deals_new
+        SELECT id, buyer_id,
+               (SELECT id FROM users WHERE username = seller_username LIMIT 1),
+               crypto_type, amount, amount, description, status, deposit_address, tx_hash,
+               created_at, updated_at
+        FROM deals
+        """)
+        await db.execute("DROP TABLE deals")
+        await db.execute("ALTER TABLE deals_new RENAME TO deals")
+
+
+async def _add_address_pool_indexes(db):
+    """Partial indexes: free addresses per currency and reservations to expire"""
+    await db.execute("""
+    CREATE INDEX IF NOT EXISTS idx_deposit_addresses_free
+    ON deposit_addresses (crypto_type) WHERE is_used = 0
+    """)
+    await db.execute("""
+    CREATE INDEX IF NOT EXISTS idx_deposit_addresses_reserved
+    ON deposit_addresses (reserved_until) WHERE is_used = 1
+    """)
+
+
+async def _add_lookup_indexes(db):
+    """Indexes for deal lookups by participant, status and address, and users by username"""
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_deals_buyer_id ON deals (buyer_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_deals_seller_id ON deals (seller_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_deals_status ON deals (status)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_deals_deposit_address ON deals (deposit_address)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)")
+
+
+async def _create_app_meta(db):
+    """Key/value store for bookkeeping such as imported file hashes"""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS app_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    """)
+
+
+async def _create_deal_events(db):
+    """Append-only deal history and (participant, created_at) indexes for keyset paging"""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS deal_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        deal_id TEXT NOT NULL,
+        from_status TEXT,
+        to_status TEXT NOT NULL,
+        tx_hash TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_deal_events_deal_id ON deal_events (deal_id, id)")
+
+    # The composite indexes cover the single-column participant ones
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_deals_buyer_created ON deals (buyer_id, created_at, id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_deals_seller_created ON deals (seller_id, created_at, id)")
+    await db.execute("DROP INDEX IF EXISTS idx_deals_buyer_id")
+    await db.execute("DROP INDEX IF EXISTS idx_deals_seller_id")
+
+
+async def _create_address_transactions(db):
+    """Ledger of transactions seen on deposit addresses and a per-address scan cursor"""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS address_transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        crypto_type TEXT NOT NULL,
+        address TEXT NOT NULL,
+        tx_hash TEXT NOT NULL,
+        value REAL NOT NULL,
+        confirmations INTEGER NOT NULL DEFAULT 0,
+        block_height INTEGER NOT NULL DEFAULT -1,
+        seen_at TIMESTAMP NOT NULL,
+        UNIQUE (crypto_type, address, tx_hash)
+    )
+    """)
+    # Transactions at or below this height are final and already in the ledger
+    if "scanned_height" not in await _table_columns(db, "deposit_addresses"):
+        await db.execute("ALTER TABLE deposit_addresses ADD COLUMN scanned_height INTEGER NOT NULL DEFAULT 0")
+
+
+async def _add_address_hooks(db):
+    """Id of the provider webhook registered for a deposit address, NULL when none"""
+    if "hook_id" not in await _table_columns(db, "deposit_addresses"):
+        await db.execute("ALTER TABLE deposit_addresses ADD COLUMN hook_id TEXT")
+
+
+async def _create_fsm_states(db):
+    """Conversation state of aiogram FSM flows, so half-finished flows survive restarts"""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_states (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        updated_at REAL NOT NULL
+    )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)")
+
+
+async def _create_outbox_messages(db):
+    """Outgoing Telegram messages not delivered yet"""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS outbox_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+async def _create_deal_id_sequence(db):
+    """Deal ID counter and permutation key; deals already present keep their random IDs"""
+    cursor = await db.execute("SELECT COALESCE(MAX(rowid), 0) FROM deals")
+    legacy_rowid = (await cursor.fetchone())[0]
+    await db.executemany(
+        "INSERT OR IGNORE INTO app_meta (key, value) VALUES (?, ?)",
+        [
+            ("deal_id_key", secrets.token_hex(32)),
+            ("deal_id_next", "0"),
+            ("deal_id_legacy_rowid", str(legacy_rowid)),
+        ]
+    )
+
+
+async def _add_settled_tx_hash_index(db):
+    """A transaction settles at most one deal, even when the address was reused"""
+    cursor = await db.execute("""
+    SELECT tx_hash, GROUP_CONCAT(id, ', ') FROM deals
+    WHERE tx_hash IS NOT NULL AND status IN ('PAID', 'SHIPPED', 'COMPLETED')
+    GROUP BY tx_hash HAVING COUNT(*) > 1
+    """)
+    duplicates = await cursor.fetchall()
+    if duplicates:
+        details = "; ".join(f"{tx_hash}: {deal_ids}" for tx_hash, deal_ids in duplicates)
+        raise RuntimeError(f"Deals settled by the same transaction must be resolved by hand first ({details})")
+
+    await db.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_deals_settled_tx_hash
+    ON deals (tx_hash) WHERE status IN ('PAID', 'SHIPPED', 'COMPLETED')
+    """)
+
+
+# Ordered schema steps: the database is at version N after MIGRATIONS[N - 1] has run.
+# Only append new steps, never reorder or edit the ones already released.
+MIGRATIONS = [
+    _create_base_schema,
+    _add_address_pool_indexes,
+    _add_lookup_indexes,
+    _create_app_meta,
+    _create_deal_events,
+    _create_address_transactions,
+    _add_address_hooks,
+    _create_fsm_states,
+    _create_outbox_messages,
+    _create_deal_id_sequence,
+    _add_settled_tx_hash_index,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def get_schema_version(db) -> int:
+    cursor = await db.execute("PRAGMA user_version")
+    return (await cursor.fetchone())[0]
+
+
+async def run_migrations(db) -> int:
+    """Brings the schema up to SCHEMA_VERSION, one transaction per step"""
+    current = await get_schema_version(db)
+    if current >= SCHEMA_VERSION:
+        return current
+
+    for version, step in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+
+        started = time.perf_counter()
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            await step(db)
+            await db.execute(f"PRAGMA user_version = {version}")
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            logger.error(f"❌ Migration {version} ({step.__name__}) failed, schema left at version {version - 1}")
+            raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"✅ Migration {version} ({step.__name__}) applied in {elapsed_ms:.1f} ms")
+
+    return SCHEMA_VERSION
@@ -0,0 +1,135 @@
+from dataclasses import dataclass, fields
+
+
+class DealStatus:
+    CREATED = "CREATED"
+    AWAITING_PAYMENT = "AWAITING_PAYMENT"
+    PAID_WAITING_ADMIN = "PAID_WAITING_ADMIN"
+    PAID = "PAID"
+    SHIPPED = "SHIPPED"
+    COMPLETED = "COMPLETED"
+    CANCELLED = "CANCELLED"
+
+
+# Allowed deal status transitions: current status -> possible next statuses
+DEAL_TRANSITIONS = {
+    DealStatus.CREATED: {DealStatus.AWAITING_PAYMENT, DealStatus.CANCELLED},
+    DealStatus.AWAITING_PAYMENT: {DealStatus.PAID_WAITING_ADMIN, DealStatus.PAID, DealStatus.CANCELLED},
+    DealStatus.PAID_WAITING_ADMIN: {DealStatus.PAID, DealStatus.CANCELLED},
+    DealStatus.PAID: {DealStatus.SHIPPED},
+    DealStatus.SHIPPED: {DealStatus.COMPLETED},
+    DealStatus.COMPLETED: set(),
+    DealStatus.CANCELLED: set(),
+}
+
+
+def can_transition(current_status: str, new_status: str) -> bool:
+    return new_status in DEAL_TRANSITIONS.get(current_status, ())
+
+
+@dataclass(slots=True)
+class User:
+    id: int
+    telegram_id: int
+    username: str
+    created_at: str
+
+
+@dataclass(slots=True)
+class Deal:
+    id: str
+    buyer_id: int
+    seller_id: int
+    crypto_type: str
+    original_amount: float
+    amount: float
+    description: str
+    status: str
+    deposit_address: str
+    tx_hash: str
+    created_at: str
+    updated_at: str
+
+
+@dataclass(slots=True)
+class DepositAddress:
+    id: int
+    crypto_type: str
+    address: str
+    is_used: bool
+    reserved_until: str
+    scanned_height: int
+    hook_id: str
+
+
+@dataclass(slots=True)
+class DealEvent:
+    id: int
+    deal_id: str
+    from_status: str
+    to_status: str
+    tx_hash: str
+    created_at: str
+
+
+@dataclass(slots=True)
+class AddressTransaction:
+    id: int
+    crypto_type: str
+    address: str
+    tx_hash: str
+    value: float
+    confirmations: int
+    block_height: int
+    seen_at: str
+
+
+@dataclass(slots=True)
+class FsmRecord:
+    key: str
+    state: str
+    data: str
+    updated_at: float
+
+
+@dataclass(slots=True)
+class OutboxMessage:
+    id: int
+    chat_id: int
+    payload: str
+    created_at: str
+
+
+# Table backing each model
+MODEL_TABLES = {
+    User: "users",
+    Deal: "deals",
+    DepositAddress: "deposit_addresses",
+    DealEvent: "deal_events",
+    AddressTransaction: "address_transactions",
+    FsmRecord: "fsm_states",
+    OutboxMessage: "outbox_messages",
+}
+
+
+def columns(model) -> tuple:
+    """Column names of a model, in the order its constructor takes them"""
+    return tuple(field.name for field in fields(model))
+
+
+def select_columns(model, alias: str = None) -> str:
+    """Explicit column list for SELECT so rows map positionally onto the model"""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(f"{prefix}{name}" for name in columns(model))
+
+
+async def verify_schema(db):
+    """Fails fast if a table no longer has the columns its model expects"""
+    for model, table in MODEL_TABLES.items():
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in await cursor.fetchall()}
+        missing = [name for name in columns(model) if name not in existing]
+        if missing:
+            raise RuntimeError(
+                f"Table '{table}' does not match model {model.__name__}: missing {', '.join(missing)}"
+            )
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+logger = logging.getLogger("escrow_bot")
+
+# Pragmas applied to every connection in the pool
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Size of the per-connection prepared statement cache
+STATEMENT_CACHE_SIZE = 256
+
+
+class ConnectionPool:
+    """Long-lived SQLite connections: one writer and several readers"""
+
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self.readers_count = max(1, readers)
+        self._writer = None
+        self._writer_lock = asyncio.Lock()
+        self._readers = []
+        self._idle_readers = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE)
+        for pragma in CONNECTION_PRAGMAS:
+            await db.execute(pragma)
+        if read_only:
+            await db.execute("PRAGMA query_only = 1")
+        return db
+
+    async def open(self):
+        """Opens the writer and reader connections (idempotent)"""
+        if self.is_open:
+            return
+
+        self._writer = await self._connect()
+        # WAL lets readers work while the writer holds a transaction
+        cursor = await self._writer.execute("PRAGMA journal_mode = WAL")
+        journal_mode = (await cursor.fetchone())[0]
+
+        self._idle_readers = asyncio.Queue()
+        for _ in range(self.readers_count):
+            reader = await self._connect(read_only=True)
+            self._readers.append(reader)
+            self._idle_readers.put_nowait(reader)
+
+        logger.info(
+            f"✅ Database pool opened: 1 writer, {self.readers_count} readers, "
+            f"journal_mode={journal_mode}"
+        )
+
+    async def close(self):
+        """Closes all pooled connections"""
+        if not self.is_open:
+            return
+
+        async with self._writer_lock:
+            for reader in self._readers:
+                await reader.close()
+            self._readers = []
+            self._idle_readers = None
+
+            await self._writer.close()
+            self._writer = None
+
+        logger.info("✅ Database pool closed")
+
+    @asynccontextmanager
+    async def reader(self):
+        """Borrows a read-only connection from the pool"""
+        if not self.is_open:
+            raise RuntimeError("Database pool is not open. Call init_db() first.")
+
+        db = await self._idle_readers.get()
+        try:
+            yield db
+        finally:
+            self._idle_readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def writer(self):
+        """Exclusive access to the writer connection, committed on success"""
+        if not self.is_open:
+            raise RuntimeError("Database pool is not open. Call init_db() first.")
+
+        async with self._writer_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            else:
+                await self._writer.commit()
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+
+logger = logging.getLogger("escrow_bot")
+
+
+class WriteQueue:
+    """Single writer coroutine that group-commits queued write operations.
+
+    Each operation is an async callable taking the writer connection. Operations
+    collected within `max_delay` seconds (up to `max_batch` of them) share one
+    transaction; each runs in its own savepoint, so a failing operation is rolled
+    back alone and its caller gets the exception.
+    """
+
+    def __init__(self, pool, max_batch: int = 100, max_delay: float = 0.002):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.operations = 0
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commits everything already queued, then stops the writer"""
+        if not self.is_running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def submit(self, operation):
+        """Queues a write and waits until the transaction containing it commits"""
+        if not self.is_running:
+            raise RuntimeError("Write queue is not running. Call init_db() first.")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((operation, future))
+        return await future
+
+    def _drain(self, batch: list):
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_batch and self.max_delay > 0:
+                await asyncio.sleep(self.max_delay)
+                self._drain(batch)
+
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit(self, batch: list):
+        outcomes = []
+        try:
+            async with self.pool.writer() as db:
+                if not db.in_transaction:
+                    await db.execute("BEGIN IMMEDIATE")
+                for operation, future in batch:
+                    await db.execute("SAVEPOINT write_op")
+                    try:
+                        result = await operation(db)
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO write_op")
+                        await db.execute("RELEASE write_op")
+                        outcomes.append((future, None, e))
+                    else:
+                        await db.execute("RELEASE write_op")
+                        outcomes.append((future, result, None))
+        except Exception as e:
+            # The whole transaction failed to commit, nothing in it was written
+            logger.exception(f"❌ Group commit of {len(batch)} writes failed: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "operations": self.operations, "queued": self._queue.qsize()}
@@ -1,17 +1,16 @@
 import re
-import string
-import random
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
-from database.db import get_next_deposit_address, create_deal, create_user, get_user_by_username, get_user_by_id
+from database.db import allocate_deal_id, get_next_deposit_address, create_deal, create_user, get_user_by_username, get_user_by_telegram_id, get_users_by_ids
 from utils.crypto_utils import encrypt_data
 from keyboards import (
     get_inline_crypto_keyboard,
     get_deal_info_keyboard,
     get_contact_admin_keyboard
 )
+from utils.outbox import outbox
 from config import load_config
 import logging
 
@@ -24,10 +23,6 @@ class CreateDeal(StatesGroup):
     waiting_for_amount = State()
     waiting_for_description = State()
 
-def generate_deal_id() -> str:
-    chars = string.ascii_uppercase + string.digits
-    return ''.join(random.choices(chars, k=6))
-
 def calculate_commission(original_amount: float) -> float:
     return round(original_amount * 1.02, 8)
 
@@ -84,7 +79,7 @@ async def process_seller(message: Message, state: FSMContext):
     
     await state.update_data(
         seller_username=seller_username,
-        seller_id=seller["id"]
+        seller_id=seller.id
     )
     
     await message.answer(
@@ -165,7 +160,7 @@ async def process_description(message: Message, state: FSMContext):
         return
     
     data = await state.get_data()
-    deal_id = generate_deal_id()
+    deal_id = await allocate_deal_id()
     
     try:
         deposit_address = await get_next_deposit_address(data["crypto_type"])
@@ -182,11 +177,11 @@ async def process_description(message: Message, state: FSMContext):
     
     encrypted_description = encrypt_data(message.text)
     
-    buyer = await get_user_by_id(message.from_user.id)
+    buyer = await get_user_by_telegram_id(message.from_user.id)
     
     deal_data = {
         "id": deal_id,
-        "buyer_id": buyer["id"] if buyer else message.from_user.id,
+        "buyer_id": buyer.id if buyer else message.from_user.id,
         "seller_id": data["seller_id"],
         "crypto_type": data["crypto_type"],
         "original_amount": data["amount"],
@@ -198,11 +193,12 @@ async def process_description(message: Message, state: FSMContext):
     
     await create_deal(deal_data)
     
-    buyer_data = await get_user_by_id(deal_data["buyer_id"])
-    seller_data = await get_user_by_id(deal_data["seller_id"])
+    participants = await get_users_by_ids([deal_data["buyer_id"], deal_data["seller_id"]])
+    buyer_data = participants.get(deal_data["buyer_id"])
+    seller_data = participants.get(deal_data["seller_id"])
     
-    buyer_username = buyer_data["username"] if buyer_data else f"user_{deal_data['buyer_id']}"
-    seller_username = seller_data["username"] if seller_data else f"user_{deal_data['seller_id']}"
+    buyer_username = buyer_data.username if buyer_data else f"user_{deal_data['buyer_id']}"
+    seller_username = seller_data.username if seller_data else f"user_{deal_data['seller_id']}"
     
     deal_info = (
         f"✅ <b>DEAL CREATED!</b>\n\n"
@@ -228,33 +224,34 @@ async def process_description(message: Message, state: FSMContext):
         parse_mode="HTML"
     )
     
-    try:
-        if seller_data and seller_data.get("telegram_id"):
-            await message.bot.send_message(
-                seller_data["telegram_id"],
-                (
-                    f"🛒 <b>New deal created for you!</b>\n\n"
-                    f"🆔 <b>Deal ID</b>: <code>{deal_id}</code>\n"
-                    f"💰 <b>Amount</b>: {data['amount']} {data['crypto_type']}\n"
-                    f"💸 <b>Amount to pay</b>: {data['amount_with_commission']:.8f} {data['crypto_type']}\n"
-                    f"   • Including 2% service fee\n"
-                    f"📦 <b>Item</b>: {message.text}\n"
-                    f"👤 <b>Buyer</b>: @{buyer_username}\n\n"
-                    f"ℹ️ <b>Actions</b>:\n"
-                    f"• Wait for payment confirmation from administrator\n"
-                    f"• After confirmation, ship the item\n"
-                    f"• Click 'Item shipped' in the deal"
+    if seller_data and seller_data.telegram_id:
+        # The buyer gets the fallback if the seller can't be reached (e.g. blocked the bot)
+        await outbox.send(
+            seller_data.telegram_id,
+            (
+                f"🛒 <b>New deal created for you!</b>\n\n"
+                f"🆔 <b>Deal ID</b>: <code>{deal_id}</code>\n"
+                f"💰 <b>Amount</b>: {data['amount']} {data['crypto_type']}\n"
+                f"💸 <b>Amount to pay</b>: {data['amount_with_commission']:.8f} {data['crypto_type']}\n"
+                f"   • Including 2% service fee\n"
+                f"📦 <b>Item</b>: {message.text}\n"
+                f"👤 <b>Buyer</b>: @{buyer_username}\n\n"
+                f"ℹ️ <b>Actions</b>:\n"
+                f"• Wait for payment confirmation from administrator\n"
+                f"• After confirmation, ship the item\n"
+                f"• Click 'Item shipped' in the deal"
+            ),
+            parse_mode="HTML",
+            reply_markup=get_deal_info_keyboard(deal_id, "seller", deposit_address, data["crypto_type"]),
+            fallback={
+                "chat_id": message.chat.id,
+                "text": (
+                    f"⚠️ <b>Failed to notify seller</b> @{seller_username}!\n\n"
+                    f"Please inform them <b>manually</b>:\n"
+                    f"🆔 Deal ID: <code>{deal_id}</code>"
                 ),
-                parse_mode="HTML",
-                reply_markup=get_deal_info_keyboard(deal_id, "seller", deposit_address, data["crypto_type"])
-            )
-    except Exception as e:
-        logger.error(f"❌ Error notifying seller for deal {deal_id}: {str(e)}")
-        await message.answer(
-            f"⚠️ <b>Failed to notify seller</b> @{seller_username}!\n\n"
-            f"Please inform them <b>manually</b>:\n"
-            f"🆔 Deal ID: <code>{deal_id}</code>",
-            parse_mode="HTML"
+                "parse_mode": "HTML"
+            }
         )
     
     await state.clear()
\ No newline at end of file
@@ -1,6 +1,6 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
-from database.db import get_deal_by_id, get_user_by_id
+from database.db import deal_may_exist, get_deal_with_participants
 from utils.crypto_utils import decrypt_data
 from keyboards import get_deal_info_keyboard, get_contact_admin_keyboard
 from config import load_config
@@ -21,7 +21,10 @@ async def start_verification(message: Message):
 @router.message(F.text.regexp(r'^[A-Z0-9]{6}$'))
 async def process_deal_id(message: Message):
     deal_id = message.text.strip().upper()
-    deal = await get_deal_by_id(deal_id)
+    # Random IDs typed by users are turned away without a database query
+    deal, buyer, seller = None, None, None
+    if deal_may_exist(deal_id):
+        deal, buyer, seller = await get_deal_with_participants(deal_id)
     
     if not deal:
         await message.answer(
@@ -31,45 +34,45 @@ async def process_deal_id(message: Message):
         )
         return
     
-    buyer = await get_user_by_id(deal["buyer_id"])
-    seller = await get_user_by_id(deal["seller_id"])
-    
-    buyer_username = buyer["username"] if buyer else f"user_{deal['buyer_id']}"
-    seller_username = seller["username"] if seller else f"user_{deal['seller_id']}"
+    buyer_username = buyer.username if buyer else f"user_{deal.buyer_id}"
+    seller_username = seller.username if seller else f"user_{deal.seller_id}"
     
     try:
-        description = decrypt_data(deal["description"])
+        description = decrypt_data(deal.description)
     except:
         description = "Decryption error"
     
     status_map = {
         "AWAITING_PAYMENT": "⏳ Awaiting payment",
+        "PAID_WAITING_ADMIN": "🔍 Payment being verified",
         "PAID": "💰 Payment confirmed",
         "SHIPPED": "🚚 Item shipped",
-        "COMPLETED": "✅ Deal completed"
+        "COMPLETED": "✅ Deal completed",
+        "CANCELLED": "🚫 Deal cancelled"
     }
     
-    status_text = status_map.get(deal["status"], deal["status"])
+    status_text = status_map.get(deal.status, deal.status)
     
     deal_info = (
-        f"🆔 <b>Deal ID</b>: <code>{deal['id']}</code>\n"
-        f"💰 <b>Amount</b>: {deal['amount']} {deal['crypto_type']}\n"
+        f"🆔 <b>Deal ID</b>: <code>{deal.id}</code>\n"
+        f"💰 <b>Amount</b>: {deal.amount} {deal.crypto_type}\n"
         f"📦 <b>Item</b>: {description}\n"
-        f"📥 <b>Deposit address</b>: <code>{deal['deposit_address']}</code>\n"
+        f"📥 <b>Deposit address</b>: <code>{deal.deposit_address}</code>\n"
         f"📊 <b>Status</b>: {status_text}\n\n"
         f"👥 <b>Participants</b>:\n"
         f"• Buyer: @{buyer_username}\n"
         f"• Seller: @{seller_username}"
     )
     
-    role = "buyer" if message.from_user.id == deal["buyer_id"] else "seller"
+    # deals store internal user IDs, compare against the buyer's Telegram ID
+    role = "buyer" if buyer and message.from_user.id == buyer.telegram_id else "seller"
     
     keyboard = get_deal_info_keyboard(
         deal_id, 
         role, 
-        deal["deposit_address"], 
-        deal["crypto_type"]
-    ) if deal["status"] != "COMPLETED" else None
+        deal.deposit_address, 
+        deal.crypto_type
+    ) if deal.status not in ("COMPLETED", "CANCELLED") else None
     
     await message.answer(
         deal_info,
@@ -0,0 +1,71 @@
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery
+from database.db import get_user_by_telegram_id, get_user_deals_page
+from keyboards import get_my_deals_keyboard
+import logging
+
+router = Router()
+logger = logging.getLogger("escrow_bot")
+
+DEALS_PER_PAGE = 5
+
+STATUS_ICONS = {
+    "CREATED": "🆕",
+    "AWAITING_PAYMENT": "⏳",
+    "PAID_WAITING_ADMIN": "🔍",
+    "PAID": "💰",
+    "SHIPPED": "🚚",
+    "COMPLETED": "✅",
+    "CANCELLED": "🚫"
+}
+
+async def render_deals_page(telegram_id: int, cursor: str = None, direction: str = "next"):
+    """Returns (text, keyboard) for one page of the user's deals"""
+    user = await get_user_by_telegram_id(telegram_id)
+    if not user:
+        return "❌ You are not registered yet. Send /start first.", None
+    
+    deals, has_more = await get_user_deals_page(user.id, cursor, direction, DEALS_PER_PAGE)
+    
+    if not deals:
+        return "📋 <b>You have no deals yet</b>\n\nCreate one with /create_deal", None
+    
+    lines = ["📋 <b>Your deals</b>\n"]
+    for deal in deals:
+        role = "🛒 buyer" if deal.buyer_id == user.id else "🤝 seller"
+        icon = STATUS_ICONS.get(deal.status, "•")
+        lines.append(
+            f"{icon} <code>{deal.id}</code> | {deal.amount} {deal.crypto_type} | {role}\n"
+            f"   {deal.status} · {deal.created_at}"
+        )
+    lines.append("\nSend a deal ID to see its details")
+    
+    # Moving forward there is always a newer page behind us, and vice versa
+    if direction == "next":
+        prev_cursor = deals[0].id if cursor else None
+        next_cursor = deals[-1].id if has_more else None
+    else:
+        prev_cursor = deals[0].id if has_more else None
+        next_cursor = deals[-1].id
+    
+    return "\n".join(lines), get_my_deals_keyboard(prev_cursor, next_cursor)
+
+@router.message(Command("my_deals"))
+async def cmd_my_deals(message: Message):
+    text, keyboard = await render_deals_page(message.from_user.id)
+    await message.answer(text, parse_mode="HTML", reply_markup=keyboard)
+
+@router.callback_query(F.data == "my_deals")
+async def handle_my_deals(callback: CallbackQuery):
+    """Handler for 'My deals' button"""
+    text, keyboard = await render_deals_page(callback.from_user.id)
+    await callback.answer()
+    await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
+
+@router.callback_query(F.data.startswith("my_deals:"))
+async def handle_my_deals_page(callback: CallbackQuery):
+    _, direction, cursor = callback.data.split(":")
+    text, keyboard = await render_deals_page(callback.from_user.id, cursor, direction)
+    await callback.answer()
+    await callback.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
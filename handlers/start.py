@@ -24,6 +24,7 @@ async def cmd_start(message: Message):
         "🛠️ <b>Main commands</b>:\n"
         "/create_deal — Create a new deal\n"
         "/verify_deal — Check deal status\n"
+        "/my_deals — List your deals\n"
         "/help — Help and support",
         parse_mode="HTML",
         reply_markup=get_main_menu_keyboard()
@@ -41,9 +42,11 @@ async def cmd_help(message: Message):
         "<b>Deal statuses:</b>\n"
         "• CREATED — Deal created\n"
         "• AWAITING_PAYMENT — Awaiting payment\n"
+        "• PAID_WAITING_ADMIN — Payment being verified\n"
         "• PAID — Payment confirmed\n"
         "• SHIPPED — Item shipped\n"
-        "• COMPLETED — Funds transferred to seller\n\n"
+        "• COMPLETED — Funds transferred to seller\n"
+        "• CANCELLED — Deal cancelled\n\n"
         "<b>Important!</b>\n"
         "• All payments through escrow wallet\n"
         "• If issues arise, click 'Help'",
@@ -1,9 +1,11 @@
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
-from database.db import get_deal_by_id, update_deal_status
+from database.db import get_deal_by_id, get_deal_with_participants, update_deal_status
+from database.models import DealStatus
 from utils.crypto_utils import decrypt_data
 from config import load_config
 from keyboards import get_admin_payment_keyboard, get_blockchain_url
+from utils.outbox import outbox
 import logging
 
 router = Router()
@@ -13,7 +15,7 @@ logger = logging.getLogger("escrow_bot")
 @router.callback_query(F.data.startswith("payment_confirmed:"))
 async def handle_payment_confirmation(callback: CallbackQuery):
     deal_id = callback.data.split(":")[1]
-    deal = await get_deal_by_id(deal_id)
+    deal, buyer, seller = await get_deal_with_participants(deal_id)
     
     if not deal:
         await callback.answer("❌ Deal not found", show_alert=True)
@@ -21,35 +23,36 @@ async def handle_payment_confirmation(callback: CallbackQuery):
     
     # Decrypt description
     try:
-        description = decrypt_data(deal["description"])
+        description = decrypt_data(deal.description)
     except Exception as e:
         description = "Decryption error"
         logger.error(f"❌ Error decrypting description for deal {deal_id}: {str(e)}")
     
-    # Update deal status
-    await update_deal_status(deal_id, "PAID_WAITING_ADMIN")
+    seller_username = seller.username if seller else f"user_{deal.seller_id}"
     
-    # Notify administrators
+    # Update deal status; a repeated tap must not notify administrators twice
+    if not await update_deal_status(deal_id, DealStatus.PAID_WAITING_ADMIN, expected_status=DealStatus.AWAITING_PAYMENT):
+        await callback.answer("ℹ️ Payment for this deal is already being verified", show_alert=True)
+        return
+    
+    # Notify administrators (queued, the outbox sends them in the background)
     for admin_id in config.admin_telegram_ids:
-        try:
-            await callback.bot.send_message(
-                admin_id,
-                f"🚨 <b>New payment for confirmation</b>\n\n"
-                f"🆔 <b>Deal ID</b>: <code>{deal_id}</code>\n"
-                f"💰 <b>Amount</b>: {deal['amount']} {deal['crypto_type']}\n"
-                f"📦 <b>Item</b>: {description}\n"
-                f"👤 <b>Buyer</b>: @{callback.from_user.username or callback.from_user.id}\n"
-                f"🤝 <b>Seller</b>: @{deal['seller_username']}\n"
-                f"🔗 <b>Deposit address</b>: <code>{deal['deposit_address']}</code>",
-                parse_mode="HTML",
-                reply_markup=get_admin_payment_keyboard(
-                    deal_id, 
-                    deal["crypto_type"],
-                    deal["deposit_address"]
-                )
+        await outbox.send(
+            admin_id,
+            f"🚨 <b>New payment for confirmation</b>\n\n"
+            f"🆔 <b>Deal ID</b>: <code>{deal_id}</code>\n"
+            f"💰 <b>Amount</b>: {deal.amount} {deal.crypto_type}\n"
+            f"📦 <b>Item</b>: {description}\n"
+            f"👤 <b>Buyer</b>: @{callback.from_user.username or callback.from_user.id}\n"
+            f"🤝 <b>Seller</b>: @{seller_username}\n"
+            f"🔗 <b>Deposit address</b>: <code>{deal.deposit_address}</code>",
+            parse_mode="HTML",
+            reply_markup=get_admin_payment_keyboard(
+                deal_id, 
+                deal.crypto_type,
+                deal.deposit_address
             )
-        except Exception as e:
-            logger.error(f"❌ Error sending notification to admin {admin_id}: {str(e)}")
+        )
     
     # Update user message
     await callback.answer("✅ Your payment has been sent for verification", show_alert=True)
@@ -68,15 +71,15 @@ async def handle_contact_admin(callback: CallbackQuery):
     # Form message for administrator
     if deal:
         try:
-            description = decrypt_data(deal["description"])
+            description = decrypt_data(deal.description)
         except:
-            description = deal["description"]
+            description = deal.description
             
         message_text = (
             f"🆘 <b>Help request for deal {deal_id}</b>\n\n"
             f"User: @{callback.from_user.username}\n"
             f"Deal: {description}\n"
-            f"Amount: {deal['amount']} {deal['crypto_type']}"
+            f"Amount: {deal.amount} {deal.crypto_type}"
         )
     else:
         message_text = (
@@ -87,14 +90,7 @@ async def handle_contact_admin(callback: CallbackQuery):
     
     # Send to administrators
     for admin_id in config.admin_telegram_ids:
-        try:
-            await callback.bot.send_message(
-                admin_id,
-                message_text,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.error(f"❌ Error sending help request to admin {admin_id}: {str(e)}")
+        await outbox.send(admin_id, message_text, parse_mode="HTML")
     
     # Show information to user
     if config.admin_username:
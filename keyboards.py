@@ -13,7 +13,8 @@ def get_main_menu_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🏠 Main Menu", callback_data="main_menu")],
         [InlineKeyboardButton(text="🔄 Create Deal", callback_data="create_deal")],
-        [InlineKeyboardButton(text="🔍 Verify Deal", callback_data="verify_deal")]
+        [InlineKeyboardButton(text="🔍 Verify Deal", callback_data="verify_deal")],
+        [InlineKeyboardButton(text="📋 My Deals", callback_data="my_deals")]
     ])
 
 def get_inline_crypto_keyboard():
@@ -139,6 +140,15 @@ def get_admin_error_keyboard(deal_id: str, crypto_type: str, deposit_address: st
     
     return builder
 
+def get_my_deals_keyboard(prev_cursor: str = None, next_cursor: str = None):
+    """Pagination buttons for the user's deal list"""
+    row = []
+    if prev_cursor:
+        row.append(InlineKeyboardButton(text="⬅️ Newer", callback_data=f"my_deals:prev:{prev_cursor}"))
+    if next_cursor:
+        row.append(InlineKeyboardButton(text="Older ➡️", callback_data=f"my_deals:next:{next_cursor}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
+
 def get_contact_admin_keyboard(deal_id: str = None):
     """Button to contact administrator"""
     if config.admin_username:
@@ -2,9 +2,26 @@ import asyncio
 import logging
 import sys
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
-from database.db import init_db
+from database.db import (
+    init_db, close_db, refresh_deal_ids, deal_id_filter_stats, user_cache_stats,
+    write_queue
+)
+from database.fsm_storage import SQLiteStorage
+from middlewares.metrics import setup_metrics
+from middlewares.throttling import setup_throttling
+from utils import metrics
+from utils.blockchain import address_cache_stats, hedge_stats, provider_stats
+from utils.tasks import run_periodically, cancel_tasks, wait_for_shutdown
+from utils.payment_watcher import PaymentWatcher, expire_unpaid_deals
+from utils.payment_webhooks import PaymentWebhooks
+from utils.telegram_webhook import TelegramWebhook, telegram_secret_token
+from utils.web_server import WebServer
+from utils.http_client import close_session
+from utils.outbox import outbox
 from config import load_config
 
 # Настройка логгера с выводом в консоль
@@ -20,6 +37,12 @@ logger = logging.getLogger("escrow_bot")
 load_dotenv()
 
 async def main():
+    background_tasks = []
+    web_server = None
+    metrics_server = None
+    telegram_webhook = None
+    fsm_storage = None
+    bot = None
     try:
         logger.info("🚀 Начинаем запуск бота...")
         
@@ -34,14 +57,70 @@ async def main():
         logger.info("🔄 Инициализируем базу данных...")
         await init_db()
         
-        bot = Bot(token=config.bot_token)
-        storage = MemoryStorage()
+        # Свой сервер Bot API (локальный telegram-bot-api или тестовый), если задан
+        session = None
+        if config.telegram_api_url:
+            session = AiohttpSession(api=TelegramAPIServer.from_base(config.telegram_api_url))
+        bot = Bot(token=config.bot_token, session=session)
+        if config.fsm_storage == "sqlite":
+            # Состояния диалогов в базе, чтобы незаконченные сделки переживали перезапуск
+            fsm_storage = SQLiteStorage(
+                cache_size=config.fsm_cache_size,
+                cache_ttl=config.fsm_cache_ttl,
+                state_ttl=config.fsm_state_ttl
+            )
+            background_tasks.append(asyncio.create_task(run_periodically(
+                fsm_storage.flush,
+                config.fsm_flush_interval,
+                "FSM flush"
+            )))
+            background_tasks.append(asyncio.create_task(run_periodically(
+                fsm_storage.expire,
+                config.address_sweep_interval,
+                "FSM expiry"
+            )))
+            storage = fsm_storage
+        else:
+            storage = MemoryStorage()
         dp = Dispatcher(storage=storage)
+        # Ограничение частоты сообщений и нажатий кнопок от одного пользователя
+        setup_throttling(dp)
+        # Сделки, созданные другими процессами бота, попадают в фильтр ID
+        background_tasks.append(asyncio.create_task(run_periodically(
+            refresh_deal_ids,
+            config.deal_id_filter_refresh_interval,
+            "deal ID filter refresh"
+        )))
+        
+        # Исходящие сообщения отправляются фоновыми воркерами с учётом лимитов Telegram
+        await outbox.start(bot)
+        
+        # Освобождение просроченных адресов в фоне (с отменой неоплаченных сделок и уведомлением покупателя)
+        background_tasks.append(asyncio.create_task(run_periodically(
+            expire_unpaid_deals,
+            config.address_sweep_interval,
+            "address sweeper"
+        )))
+        
+        # Приём webhook-уведомлений о платежах
+        payment_webhooks = None
+        if config.web_server_port:
+            web_server = WebServer(config.web_server_host, config.web_server_port)
+            payment_webhooks = PaymentWebhooks(config.public_url)
+            payment_webhooks.register_routes(web_server.app)
+        
+        # Автоматическая проверка оплаты открытых сделок
+        payment_watcher = PaymentWatcher(
+            concurrency=config.payment_watch_concurrency,
+            checks_per_hour=config.payment_watch_checks_per_hour,
+            webhooks=payment_webhooks
+        )
+        background_tasks.append(asyncio.create_task(payment_watcher.run(config.payment_watch_interval)))
         
         # Динамический импорт обработчиков
         try:
             logger.info("🔄 Подключаем обработчики...")
-            from handlers import start, deal_creation, deal_verification, admin, main_menu, user_actions  # ДОБАВЛЕН user_actions
+            from handlers import start, deal_creation, deal_verification, admin, main_menu, user_actions, my_deals  # ДОБАВЛЕН user_actions
             
             # Проверка наличия роутеров
             for handler_name, handler in [
@@ -50,7 +129,8 @@ async def main():
                 ("deal_verification", deal_verification),
                 ("admin", admin),
                 ("main_menu", main_menu),
-                ("user_actions", user_actions)  # ДОБАВЛЕН в список проверки
+                ("user_actions", user_actions),  # ДОБАВЛЕН в список проверки
+                ("my_deals", my_deals)
             ]:
                 if hasattr(handler, 'router'):
                     logger.debug(f"✅ Подключен роутер: {handler_name}")
@@ -64,13 +144,90 @@ async def main():
             logger.exception(f"❌ Ошибка при подключении обработчиков: {str(e)}")
             return
         
+        if config.bot_mode == "webhook":
+            if not web_server or not config.public_url:
+                logger.error("❌ ОШИБКА: Для режима webhook нужны WEB_SERVER_PORT и PUBLIC_URL")
+                return
+            telegram_webhook = TelegramWebhook(
+                dp,
+                bot,
+                telegram_secret_token(),
+                max_concurrent=config.telegram_webhook_max_concurrent
+            )
+            telegram_webhook.register_routes(web_server.app, config.telegram_webhook_path)
+        
+        # Метрики Prometheus на отдельном локальном порту
+        if config.metrics_port:
+            setup_metrics(dp)
+            metrics.register_stats("provider", provider_stats, label="provider")
+            metrics.register_stats("hedge", hedge_stats)
+            metrics.register_stats("address_cache", address_cache_stats)
+            metrics.register_stats("user_cache", user_cache_stats, label="cache")
+            metrics.register_stats("deal_id_filter", deal_id_filter_stats)
+            metrics.register_stats("write_queue", write_queue.stats)
+            metrics.register_stats("outbox", outbox.queue_stats)
+            metrics.register_stats("payment_watcher", lambda: payment_watcher.stats)
+            if payment_webhooks:
+                metrics.register_stats("payment_webhooks", lambda: payment_webhooks.stats)
+            if telegram_webhook:
+                metrics.register_stats("telegram_webhook", lambda: telegram_webhook.stats)
+            if fsm_storage:
+                metrics.register_stats("fsm", fsm_storage.cache_stats)
+            metrics_server = WebServer(config.metrics_host, config.metrics_port)
+            metrics.register_routes(metrics_server.app)
+            await metrics_server.start()
+        
+        # Маршруты добавлены, запускаем веб-сервер
+        if web_server:
+            await web_server.start()
+            background_tasks.append(asyncio.create_task(run_periodically(
+                payment_webhooks.sync,
+                config.webhook_sync_interval,
+                "payment hook sync"
+            )))
+        
         logger.info("✅ Бот полностью настроен")
-        logger.info("🌐 Начинаем polling...")
-        await dp.start_polling(bot)
+        if telegram_webhook:
+            logger.info("🌐 Устанавливаем webhook...")
+            await bot.set_webhook(
+                f"{config.public_url.rstrip('/')}{config.telegram_webhook_path}",
+                secret_token=telegram_webhook.secret_token,
+                allowed_updates=dp.resolve_used_update_types(),
+                max_connections=config.telegram_webhook_max_connections
+            )
+            await dp.emit_startup(bot=bot)
+            await wait_for_shutdown()
+            logger.info("🛑 Получен сигнал остановки")
+        else:
+            logger.info("🌐 Начинаем polling...")
+            # Polling не работает, пока у бота установлен webhook
+            await bot.delete_webhook()
+            await dp.start_polling(bot, close_bot_session=False)
         
     except Exception as e:
         logger.exception(f"❌ Критическая ошибка при запуске: {str(e)}")
         raise
+    finally:
+        # Сначала дожидаемся обновлений, которые уже обрабатываются
+        if telegram_webhook:
+            await telegram_webhook.drain(config.shutdown_drain_timeout)
+            await dp.emit_shutdown(bot=bot)
+        if web_server:
+            await web_server.stop()
+        if metrics_server:
+            await metrics_server.stop()
+        await cancel_tasks(background_tasks)
+        # Досылаем очередь сообщений, пока сессия бота открыта
+        if bot:
+            await outbox.stop(config.shutdown_drain_timeout)
+            await bot.session.close()
+        # Записываем последние изменения состояний до закрытия базы
+        if fsm_storage:
+            await fsm_storage.close()
+        # Закрываем общую HTTP-сессию для API блокчейна
+        await close_session()
+        # Закрываем общие соединения с базой данных
+        await close_db()
 
 if __name__ == "__main__":
     logger.info("✨ Запуск Escrow Bot")
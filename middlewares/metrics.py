@@ -0,0 +1,62 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+from utils.metrics import Counter, Histogram
+
+HANDLER_SECONDS = Histogram(
+    "escrow_handler_seconds",
+    "Time spent in update handlers",
+    ("event", "router", "handler")
+)
+HANDLER_ERRORS = Counter(
+    "escrow_handler_errors_total",
+    "Exceptions raised by update handlers",
+    ("event", "router", "handler")
+)
+
+# Observers whose handlers aren't user-facing update handlers
+SKIPPED_OBSERVERS = ("update", "error")
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing each handler; the router label is the handler's module"""
+
+    def __init__(self):
+        self._labels = {}
+
+    def labels(self, event: TelegramObject, data: Dict[str, Any]) -> tuple:
+        callback = data["handler"].callback
+        key = (type(event), callback)
+        labels = self._labels.get(key)
+        if labels is None:
+            module = getattr(callback, "__module__", "") or ""
+            name = getattr(callback, "__name__", type(callback).__name__)
+            labels = self._labels[key] = (type(event).__name__, module.rpartition(".")[2], name)
+        return labels
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(*self.labels(event, data))
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, *self.labels(event, data))
+
+
+def setup_metrics(dp: Dispatcher) -> MetricsMiddleware:
+    """Registers the middleware on the dispatcher's observers; included routers inherit it"""
+    middleware = MetricsMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in SKIPPED_OBSERVERS:
+            observer.middleware(middleware)
+    return middleware
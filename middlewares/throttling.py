@@ -0,0 +1,75 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from config import load_config
+from database.cache import TTLCache
+from utils.metrics import Counter
+from utils.rate_limit import TokenBucket
+
+config = load_config()
+
+THROTTLED_UPDATES = Counter(
+    "escrow_throttled_updates_total",
+    "Updates dropped by the per-user flood limit",
+    ("event",)
+)
+
+# Users tracked at once; an idle user's bucket is full again long before it expires
+MAX_TRACKED_USERS = 100000
+BUCKET_TTL = 600
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Outer middleware dropping a user's updates beyond `rate` per second (after a `burst`).
+
+    The user is told once per throttled streak; administrators are never throttled.
+    """
+
+    def __init__(self, rate: float, burst: int, exempt_ids=()):
+        self.rate = rate
+        self.burst = burst
+        self.exempt_ids = set(exempt_ids)
+        # user_id -> [bucket, already warned]
+        self._users = TTLCache(MAX_TRACKED_USERS, BUCKET_TTL)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id in self.exempt_ids:
+            return await handler(event, data)
+
+        entry = self._users.get(user.id)
+        if entry is None:
+            entry = [TokenBucket(self.rate, self.burst), False]
+            self._users.set(user.id, entry)
+
+        bucket = entry[0]
+        if bucket.try_acquire():
+            entry[1] = False
+            return await handler(event, data)
+
+        THROTTLED_UPDATES.inc(type(event).__name__)
+        if isinstance(event, CallbackQuery):
+            # Unanswered callbacks leave the button spinning
+            await event.answer("⏳ Too many requests, please slow down")
+        elif isinstance(event, Message) and not entry[1]:
+            await event.answer("⏳ Too many messages. Please wait a few seconds and try again.")
+        entry[1] = True
+        return None
+
+
+def setup_throttling(dp: Dispatcher):
+    """Separate per-user limits for messages and button presses"""
+    exempt = config.admin_telegram_ids
+    dp.message.outer_middleware(ThrottlingMiddleware(
+        config.throttle_message_rate, config.throttle_message_burst, exempt
+    ))
+    dp.callback_query.outer_middleware(ThrottlingMiddleware(
+        config.throttle_callback_rate, config.throttle_callback_burst, exempt
+    ))
@@ -0,0 +1,29 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import db
+from database.pool import ConnectionPool
+from database.write_queue import WriteQueue
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """database.db on a fresh SQLite file; tests call open_db()/close_db() inside their event loop"""
+    pool = ConnectionPool(str(tmp_path / "escrow.db"), readers=2)
+    monkeypatch.setattr(db, "pool", pool)
+    monkeypatch.setattr(db, "write_queue", WriteQueue(pool))
+    monkeypatch.setattr(db, "_deal_ids", None)
+    monkeypatch.setattr(db, "_deal_ids_rowid", 0)
+    monkeypatch.setattr(db, "_deal_id_lock", asyncio.Lock())
+    monkeypatch.setattr(db, "_deal_id_permutation", None)
+    monkeypatch.setattr(db, "_deal_id_legacy_rowid", 0)
+    monkeypatch.setattr(db, "_deal_id_next", 0)
+    monkeypatch.setattr(db, "_deal_id_end", 0)
+    for cache in (db._users_by_id, db._users_by_telegram_id, db._users_by_username):
+        cache.clear()
+    return db
@@ -0,0 +1,25 @@
+import pytest
+
+from database.address_import import iter_address_file
+
+
+def test_reads_addresses_per_crypto_type(tmp_path):
+    path = tmp_path / "deposit_addresses.json"
+    path.write_text('{"BTC": ["b1", "b2"], "LTC": [], "ETH": ["e1"]}')
+    assert list(iter_address_file(path)) == [("BTC", "b1"), ("BTC", "b2"), ("ETH", "e1")]
+
+
+@pytest.mark.parametrize("content", [
+    '["b1", "b2"]',
+    '{"BTC": {"b1": "b2"}}',
+    '{"BTC": [["b1"]]}',
+    '{"BTC": "b1"}',
+    '{"BTC": ["b1"]',
+    '{"BTC": ["b1"]} {}',
+    '',
+])
+def test_rejects_other_layouts(tmp_path, content):
+    path = tmp_path / "deposit_addresses.json"
+    path.write_text(content)
+    with pytest.raises(ValueError, match="deposit_addresses.json"):
+        list(iter_address_file(path))
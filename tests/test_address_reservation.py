@@ -0,0 +1,237 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database.models import DealStatus
+
+
+def make_deal(deal_id: str, address: str, status: str = DealStatus.AWAITING_PAYMENT) -> dict:
+    return {
+        "id": deal_id,
+        "buyer_id": 1,
+        "seller_id": 2,
+        "crypto_type": "BTC",
+        "original_amount": 0.01,
+        "amount": 0.0102,
+        "description": "encrypted",
+        "deposit_address": address,
+        "status": status,
+    }
+
+
+async def add_addresses(db, count: int, crypto_type: str = "BTC"):
+    async with db.pool.writer() as conn:
+        await conn.executemany(
+            "INSERT INTO deposit_addresses (crypto_type, address) VALUES (?, ?)",
+            [(crypto_type, f"{crypto_type.lower()}-address-{i}") for i in range(count)]
+        )
+
+
+def test_concurrent_reservations_hand_out_each_address_once(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            await add_addresses(database, 500)
+            return await asyncio.gather(
+                *(database.get_next_deposit_address("BTC") for _ in range(600)),
+                return_exceptions=True
+            )
+        finally:
+            await database.close_db()
+
+    results = asyncio.run(scenario())
+    addresses = [result for result in results if isinstance(result, str)]
+    assert len(addresses) == 500
+    assert len(set(addresses)) == 500
+    assert sum(isinstance(result, ValueError) for result in results) == 100
+
+
+def test_concurrent_status_updates_have_one_winner(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            await database.create_deal(make_deal("ABC123", "btc-address-0"))
+            results = await asyncio.gather(*(
+                database.update_deal_status(
+                    "ABC123", DealStatus.PAID, expected_status=DealStatus.AWAITING_PAYMENT, tx_hash=f"tx{i}"
+                )
+                for i in range(20)
+            ))
+            return results, await database.get_deal_by_id("ABC123"), await database.get_deal_events("ABC123")
+        finally:
+            await database.close_db()
+
+    results, deal, events = asyncio.run(scenario())
+    assert results.count(True) == 1
+    assert deal.status == DealStatus.PAID
+    assert deal.tx_hash == f"tx{results.index(True)}"
+    assert [event.to_status for event in events] == [DealStatus.AWAITING_PAYMENT, DealStatus.PAID]
+
+
+async def expire_reservation(db, address: str, hours_ago: int = 1):
+    async with db.pool.writer() as conn:
+        await conn.execute(
+            "UPDATE deposit_addresses SET reserved_until = datetime('now', ?) WHERE address = ?",
+            (f"-{hours_ago} hours", address)
+        )
+
+
+def test_sweep_cancels_unpaid_deal_before_address_is_reused(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            await add_addresses(database, 1)
+            address = await database.get_next_deposit_address("BTC")
+            await database.create_deal(make_deal("OLD001", address))
+            await expire_reservation(database, address, database.PAYMENT_GRACE_HOURS + 1)
+
+            cancelled = await database.release_expired_addresses()
+            reused = await database.get_next_deposit_address("BTC")
+            return address, cancelled, reused, await database.get_deal_by_id("OLD001")
+        finally:
+            await database.close_db()
+
+    address, cancelled, reused, deal = asyncio.run(scenario())
+    assert [deal.id for deal in cancelled] == ["OLD001"]
+    assert deal.status == DealStatus.CANCELLED
+    assert reused == address
+
+
+def test_sweep_keeps_address_with_payment_seen_during_reservation(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            await add_addresses(database, 1)
+            address = await database.get_next_deposit_address("BTC")
+            await database.create_deal(make_deal("LATE01", address))
+            async with database.pool.writer() as conn:
+                await conn.execute(
+                    "INSERT INTO address_transactions (crypto_type, address, tx_hash, value, seen_at) "
+                    "VALUES ('BTC', ?, 'tx1', 0.0102, datetime('now', ?, '-30 minutes'))",
+                    (address, f"-{database.PAYMENT_GRACE_HOURS + 1} hours")
+                )
+            await expire_reservation(database, address, database.PAYMENT_GRACE_HOURS + 1)
+
+            cancelled = await database.release_expired_addresses()
+            return cancelled, await database.get_deal_by_id("LATE01")
+        finally:
+            await database.close_db()
+
+    cancelled, deal = asyncio.run(scenario())
+    assert cancelled == []
+    assert deal.status == DealStatus.AWAITING_PAYMENT
+
+
+def test_sweep_cancels_reported_payment_after_grace_period(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            await add_addresses(database, 2)
+            recent = await database.get_next_deposit_address("BTC")
+            stale = await database.get_next_deposit_address("BTC")
+            await database.create_deal(make_deal("RECENT", recent, DealStatus.PAID_WAITING_ADMIN))
+            await database.create_deal(make_deal("STALE1", stale, DealStatus.PAID_WAITING_ADMIN))
+            await expire_reservation(database, recent)
+            await expire_reservation(database, stale, database.PAYMENT_GRACE_HOURS + 1)
+
+            cancelled = await database.release_expired_addresses()
+            return cancelled, await database.get_deal_by_id("RECENT"), await database.get_deal_by_id("STALE1")
+        finally:
+            await database.close_db()
+
+    cancelled, recent, stale = asyncio.run(scenario())
+    assert [deal.id for deal in cancelled] == ["STALE1"]
+    assert recent.status == DealStatus.PAID_WAITING_ADMIN
+    assert stale.status == DealStatus.CANCELLED
+
+
+def test_transaction_settles_only_one_deal(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            await database.create_deal(make_deal("FIRST1", "btc-address-0"))
+            await database.create_deal(make_deal("SECND2", "btc-address-0"))
+            return [
+                await database.update_deal_status(
+                    deal_id, DealStatus.PAID, expected_status=DealStatus.AWAITING_PAYMENT, tx_hash="tx1"
+                )
+                for deal_id in ("FIRST1", "SECND2")
+            ]
+        finally:
+            await database.close_db()
+
+    assert asyncio.run(scenario()) == [True, False]
+
+
+def test_ledger_match_is_bounded_by_reservation_window(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            await database.create_deal(make_deal("WINDOW", "btc-address-0"))
+            deal = await database.get_deal_by_id("WINDOW")
+            async with database.pool.writer() as conn:
+                await conn.executemany(
+                    "INSERT INTO address_transactions (crypto_type, address, tx_hash, value, seen_at) "
+                    "VALUES ('BTC', 'btc-address-0', ?, 0.0102, datetime(?, ?))",
+                    [("before", deal.created_at, "-1 hour"), ("during", deal.created_at, "+1 hour"),
+                     ("after", deal.created_at, "+19 hours")]
+                )
+            since, until = database.deal_payment_window(deal)
+            return await database.get_address_transactions("BTC", "btc-address-0", since, until)
+        finally:
+            await database.close_db()
+
+    assert [tx.tx_hash for tx in asyncio.run(scenario())] == ["during"]
+
+
+def test_payment_confirmed_after_reservation_still_counts(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            await add_addresses(database, 1)
+            address = await database.get_next_deposit_address("BTC")
+            await database.create_deal(make_deal("LATE02", address))
+            await expire_reservation(database, address, database.PAYMENT_GRACE_HOURS + 1)
+            async with database.pool.writer() as conn:
+                # Sent just before the reservation ended, only timestamped once it was confirmed
+                await conn.execute(
+                    "INSERT INTO address_transactions (crypto_type, address, tx_hash, value, seen_at) "
+                    "SELECT crypto_type, address, 'tx1', 0.0102, datetime(reserved_until, '+10 minutes') "
+                    "FROM deposit_addresses WHERE address = ?",
+                    (address,)
+                )
+                await conn.execute(
+                    "UPDATE deals SET created_at = (SELECT datetime(reserved_until, '-12 hours') "
+                    "FROM deposit_addresses WHERE address = ?) WHERE id = 'LATE02'",
+                    (address,)
+                )
+            deal = await database.get_deal_by_id("LATE02")
+            since, until = database.deal_payment_window(deal)
+            transactions = await database.get_address_transactions("BTC", address, since, until)
+            cancelled = await database.release_expired_addresses()
+            return transactions, cancelled, await database.get_deal_by_id("LATE02")
+        finally:
+            await database.close_db()
+
+    transactions, cancelled, deal = asyncio.run(scenario())
+    assert [tx.tx_hash for tx in transactions] == ["tx1"]
+    assert cancelled == []
+    assert deal.status == DealStatus.AWAITING_PAYMENT
+
+
+def test_settled_tx_hash_is_unique(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            await database.create_deal(make_deal("FIRST1", "btc-address-0", DealStatus.PAID))
+            await database.create_deal(make_deal("SECND2", "btc-address-0", DealStatus.PAID))
+            async with database.pool.writer() as conn:
+                await conn.execute("UPDATE deals SET tx_hash = 'tx1' WHERE id = 'FIRST1'")
+            async with database.pool.writer() as conn:
+                await conn.execute("UPDATE deals SET tx_hash = 'tx1' WHERE id = 'SECND2'")
+        finally:
+            await database.close_db()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        asyncio.run(scenario())
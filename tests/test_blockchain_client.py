@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp.test_utils import TestServer
+
+from utils import blockchain
+from utils.blockchain import BlockCypherProvider
+from utils.fake_provider import FakeProvider
+from utils.http_client import close_session
+from utils.rate_limit import Priority, RateLimiter, RateLimitExceeded, TokenBucket
+
+ADDRESS = "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"
+DELAY = 0.5
+
+
+def test_slow_provider_call_does_not_block_event_loop(tmp_path):
+    fake = FakeProvider(tmp_path)
+    fake.add_fixture(f"/btc/main/addrs/{ADDRESS}", [{"status": 200, "delay": DELAY, "body": {
+        "address": ADDRESS,
+        "txrefs": [{"tx_hash": "ab" * 32, "tx_input_n": -1, "value": 1020000, "confirmations": 3,
+                    "block_height": 800000, "confirmed": "2024-01-01T00:00:00Z"}],
+    }}])
+
+    async def scenario():
+        server = TestServer(fake.create_app())
+        await server.start_server()
+        provider = BlockCypherProvider(str(server.make_url("")))
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        try:
+            started = time.perf_counter()
+            txs = await provider.get_address_txs("BTC", ADDRESS)
+            return txs, time.perf_counter() - started, ticks
+        finally:
+            ticker_task.cancel()
+            await close_session()
+            await server.close()
+
+    txs, elapsed, ticks = asyncio.run(scenario())
+    assert [tx.value for tx in txs] == [0.0102]
+    assert elapsed >= DELAY
+    # Ticks every 10 ms kept coming while the request waited on the provider
+    assert ticks >= DELAY / 0.01 * 0.5
+
+
+def test_batched_lookup_charges_one_token_per_address(tmp_path):
+    fake = FakeProvider(tmp_path)
+    addresses = [f"{ADDRESS[:-1]}{i}" for i in range(3)]
+    for address in addresses:
+        fake.add_fixture(f"/btc/main/addrs/{address}", [{"status": 200, "body": {"txrefs": []}}])
+
+    async def scenario():
+        server = TestServer(fake.create_app())
+        await server.start_server()
+        provider = BlockCypherProvider(str(server.make_url("")), batch_size=3)
+        # No refill: the hourly quota as it stands after the batch
+        provider.limiter = RateLimiter([TokenBucket(0, 100)])
+        try:
+            results = await asyncio.gather(*(provider.get_address_txs("BTC", address) for address in addresses))
+            return results, provider.stats["requests"], provider.limiter.buckets[0].tokens
+        finally:
+            await close_session()
+            await server.close()
+
+    results, requests, tokens_left = asyncio.run(scenario())
+    assert results == [[], [], []]
+    assert requests == 1
+    assert tokens_left == 97
+
+
+def test_request_costlier_than_bucket_leaves_it_in_debt():
+    limiter = RateLimiter([TokenBucket(1, 3)])
+
+    async def scenario():
+        await limiter.acquire(tokens=20)
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire(max_wait=1)
+
+    asyncio.run(scenario())
+    assert limiter.buckets[0].tokens < -16
+
+
+def test_interactive_lookup_does_not_join_background_scan(monkeypatch):
+    scans = []
+
+    async def fake_scan(crypto_type, address, priority):
+        scans.append(priority)
+        await asyncio.sleep(0.05)
+        return [priority]
+
+    monkeypatch.setattr(blockchain, "_scan_address", fake_scan)
+    blockchain._address_cache.clear()
+
+    async def scenario():
+        background = asyncio.create_task(blockchain.get_address_txs("BTC", ADDRESS, Priority.BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(blockchain.get_address_txs("BTC", ADDRESS, Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+        # Joins the interactive scan
+        late_background = asyncio.create_task(blockchain.get_address_txs("BTC", ADDRESS, Priority.BACKGROUND))
+        return await asyncio.gather(background, interactive, late_background)
+
+    results = asyncio.run(scenario())
+    assert scans == [Priority.BACKGROUND, Priority.INTERACTIVE]
+    assert results == [[Priority.BACKGROUND], [Priority.INTERACTIVE], [Priority.INTERACTIVE]]
+    assert blockchain._in_flight == {}
+
+
+def test_cancelled_lookup_leaves_unsent_batch(tmp_path):
+    fake = FakeProvider(tmp_path)
+    kept, dropped = f"{ADDRESS[:-1]}1", f"{ADDRESS[:-1]}2"
+    fixtures = {
+        address: fake.add_fixture(f"/btc/main/addrs/{address}", [{"status": 200, "body": {"txrefs": []}}])
+        for address in (kept, dropped)
+    }
+
+    async def scenario():
+        server = TestServer(fake.create_app())
+        await server.start_server()
+        provider = BlockCypherProvider(str(server.make_url("")), batch_size=5, batch_window=0.05)
+        try:
+            cancelled = asyncio.create_task(provider.get_address_txs("BTC", dropped))
+            answered = asyncio.create_task(provider.get_address_txs("BTC", kept))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            return await answered
+        finally:
+            await close_session()
+            await server.close()
+
+    assert asyncio.run(scenario()) == []
+    assert fixtures[kept]["served"] == 1
+    assert fixtures[dropped]["served"] == 0
+
+
+def test_batch_without_waiters_gives_back_its_limiter_slot():
+    provider = BlockCypherProvider("http://127.0.0.1:9", batch_size=2)
+    # Empty and refilling slowly: the batch has to queue for a slot
+    provider.limiter = RateLimiter([TokenBucket(0.5, 2)])
+    provider.limiter.buckets[0].tokens = 0
+
+    async def scenario():
+        lookups = [asyncio.create_task(provider.get_address_txs("BTC", f"{ADDRESS}{i}")) for i in range(2)]
+        await asyncio.sleep(0.01)
+        (batch,) = provider._batches
+        for lookup in lookups:
+            lookup.cancel()
+        await asyncio.gather(*lookups, return_exceptions=True)
+        await asyncio.sleep(0)
+        return batch
+
+    batch = asyncio.run(scenario())
+    assert batch.cancelled()
+    assert provider._batches == {}
+    assert provider.limiter.stats["granted"] == 0
@@ -0,0 +1,26 @@
+import asyncio
+
+
+def test_deal_from_another_process_is_found_before_refresh(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            # Inserted behind this process's back, as another bot process would
+            async with database.pool.writer() as conn:
+                await conn.execute(
+                    "INSERT INTO deals (id, buyer_id, seller_id, crypto_type, original_amount, amount, "
+                    "deposit_address, status) VALUES ('OTHER1', 1, 2, 'BTC', 0.01, 0.0102, 'addr', 'AWAITING_PAYMENT')"
+                )
+            before_refresh = database.deal_may_exist("OTHER1")
+            deal = await database.get_deal_by_id("OTHER1")
+            found, _, _ = await database.get_deal_with_participants("OTHER1")
+            await database.refresh_deal_ids()
+            return before_refresh, deal, found, database.deal_may_exist("OTHER1")
+        finally:
+            await database.close_db()
+
+    before_refresh, deal, found, after_refresh = asyncio.run(scenario())
+    assert not before_refresh
+    assert deal.id == "OTHER1"
+    assert found.id == "OTHER1"
+    assert after_refresh
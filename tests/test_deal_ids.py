@@ -0,0 +1,94 @@
+import asyncio
+import random
+import re
+
+import pytest
+
+from utils.deal_ids import DEAL_ID_SPACE, DealIdPermutation
+
+DEAL_ID_RE = re.compile(r"^[A-Z0-9]{6}$")
+SAMPLE_SIZE = 100_000
+
+
+@pytest.fixture
+def permutation():
+    return DealIdPermutation(b"test key")
+
+
+def check_sample(permutation, counters):
+    seen = set()
+    for counter in counters:
+        deal_id = permutation.encode(counter)
+        assert DEAL_ID_RE.match(deal_id), deal_id
+        assert permutation.decode(deal_id) == counter
+        seen.add(deal_id)
+    assert len(seen) == len(counters)
+
+
+def test_consecutive_counters_give_distinct_ids(permutation):
+    start = random.randrange(DEAL_ID_SPACE - SAMPLE_SIZE)
+    check_sample(permutation, range(start, start + SAMPLE_SIZE))
+
+
+def test_random_counters_give_distinct_ids(permutation):
+    check_sample(permutation, random.sample(range(DEAL_ID_SPACE), SAMPLE_SIZE))
+
+
+def test_whole_id_space_edges(permutation):
+    check_sample(permutation, [0, 1, DEAL_ID_SPACE - 2, DEAL_ID_SPACE - 1])
+    for counter in (-1, DEAL_ID_SPACE):
+        with pytest.raises(ValueError):
+            permutation.encode(counter)
+
+
+def test_ids_depend_on_key():
+    ids = [DealIdPermutation(key).encode(0) for key in (b"key one", b"key two")]
+    assert ids[0] != ids[1]
+
+
+async def stored_permutation(db) -> DealIdPermutation:
+    async with db.pool.reader() as conn:
+        cursor = await conn.execute("SELECT value FROM app_meta WHERE key = 'deal_id_key'")
+        (key,) = await cursor.fetchone()
+    return DealIdPermutation(bytes.fromhex(key))
+
+
+def test_allocator_reserves_blocks_and_never_repeats(database, monkeypatch):
+    monkeypatch.setattr(database.config, "deal_id_block_size", 3)
+
+    async def scenario():
+        await database.open_db()
+        try:
+            ids = await asyncio.gather(*(database.allocate_deal_id() for _ in range(10)))
+            return ids, await stored_permutation(database)
+        finally:
+            await database.close_db()
+
+    ids, permutation = asyncio.run(scenario())
+    assert sorted(permutation.decode(deal_id) for deal_id in ids) == list(range(10))
+
+
+def test_allocator_skips_ids_of_legacy_deals(database):
+    async def scenario():
+        await database.open_db()
+        try:
+            permutation = await stored_permutation(database)
+            # A deal from before the allocator whose random ID happens to be the first counter's
+            legacy_id = permutation.encode(0)
+            async with database.pool.writer() as conn:
+                cursor = await conn.execute(
+                    "INSERT INTO deals (id, buyer_id, seller_id, crypto_type, original_amount, amount, "
+                    "deposit_address, status) VALUES (?, 1, 2, 'BTC', 0.01, 0.0102, 'addr', 'COMPLETED')",
+                    (legacy_id,)
+                )
+                await conn.execute(
+                    "UPDATE app_meta SET value = ? WHERE key = 'deal_id_legacy_rowid'", (str(cursor.lastrowid),)
+                )
+            await database.load_deal_ids()
+            return legacy_id, await database.allocate_deal_id(), permutation
+        finally:
+            await database.close_db()
+
+    legacy_id, allocated, permutation = asyncio.run(scenario())
+    assert allocated != legacy_id
+    assert permutation.decode(allocated) == 1
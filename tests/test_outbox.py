@@ -0,0 +1,39 @@
+import asyncio
+
+from utils import outbox as outbox_module
+from utils.outbox import Outbox
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def test_worker_survives_unexpected_error(monkeypatch):
+    monkeypatch.setattr(outbox_module, "MAX_RETRY_DELAY", 0.01)
+
+    async def scenario():
+        outbox = Outbox(workers=1, persist=False)
+        acquire = outbox.limiter.acquire
+        failures = [RuntimeError("limiter broke")]
+
+        async def flaky_acquire(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return await acquire(*args, **kwargs)
+
+        outbox.limiter.acquire = flaky_acquire
+        bot = FakeBot()
+        await outbox.start(bot)
+        await outbox.send(1, "first")
+        await outbox.send(2, "second")
+        await outbox.stop(timeout=5)
+        return bot.sent, outbox.queue_stats()
+
+    sent, stats = asyncio.run(scenario())
+    assert sorted(sent) == [(1, "first"), (2, "second")]
+    assert stats["pending"] == 0
+    assert stats["chats"] == 0
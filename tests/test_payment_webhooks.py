@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from database.models import DealStatus
+from utils import blockchain, payment_watcher
+from utils.blockchain import TxRef, utc_timestamp
+from utils.payment_webhooks import PaymentWebhooks
+from utils.rate_limit import Priority
+
+ADDRESS = "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"
+TX_HASH = "ab" * 32
+
+
+def make_deal(deal_id: str) -> dict:
+    return {
+        "id": deal_id, "buyer_id": 1, "seller_id": 2, "crypto_type": "BTC", "original_amount": 0.01,
+        "amount": 0.0102, "description": "encrypted", "deposit_address": ADDRESS,
+        "status": DealStatus.AWAITING_PAYMENT,
+    }
+
+
+def pushed_tx(value: float = 0.0102) -> dict:
+    return {"hash": TX_HASH, "confirmations": 6, "block_height": 800000, "outputs": [
+        {"addresses": [ADDRESS], "value": int(value * 1e8)},
+    ]}
+
+
+async def process(webhooks):
+    return await webhooks.process_transaction(pushed_tx())
+
+
+def post(body, secret: str = "test"):
+    """Delivers `body` through the registered callback route; returns (status, response text)"""
+    async def deliver(webhooks):
+        app = web.Application()
+        webhooks.register_routes(app)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(
+                f"/webhooks/blockcypher/{secret}", data=body, headers={"Content-Type": "application/json"}
+            )
+            return response.status, await response.text()
+
+    return deliver
+
+
+def run_callback(database, monkeypatch, provider_txs: list, deal_ids=("HOOK01",), push=process):
+    """Pushes pushed_tx() for open deals on ADDRESS while the provider reports `provider_txs`"""
+    lookups = []
+
+    async def fake_fetch(crypto_type, address, priority, after_height):
+        lookups.append((address, priority))
+        return provider_txs
+
+    async def fake_send(chat_id, text, **kwargs):
+        pass
+
+    monkeypatch.setattr(blockchain, "fetch_address_txs", fake_fetch)
+    monkeypatch.setattr(payment_watcher.outbox, "send", fake_send)
+    blockchain._address_cache.clear()
+
+    async def scenario():
+        await database.open_db()
+        try:
+            for deal_id in deal_ids:
+                await database.create_deal(make_deal(deal_id))
+            webhooks = PaymentWebhooks(secret="test")
+            await webhooks.sync()
+            result = await push(webhooks)
+            ledger = await database.get_address_transactions("BTC", ADDRESS)
+            return result, [tx.tx_hash for tx in ledger], webhooks.stats
+        finally:
+            await database.close_db()
+
+    result, ledger, stats = asyncio.run(scenario())
+    return result, ledger, lookups, stats
+
+
+def test_pushed_values_are_not_trusted(database, monkeypatch):
+    settled, ledger, lookups, _ = run_callback(database, monkeypatch, provider_txs=[])
+    assert settled == []
+    assert ledger == []
+    assert lookups == [(ADDRESS, Priority.BACKGROUND)]
+
+
+def test_callback_settles_after_provider_confirms(database, monkeypatch):
+    confirmed = TxRef(tx_hash=TX_HASH, value=0.0102, confirmations=6, block_height=800000, seen_at=utc_timestamp())
+    settled, ledger, _, _ = run_callback(database, monkeypatch, provider_txs=[confirmed])
+    assert settled == ["HOOK01"]
+    assert ledger == [TX_HASH]
+
+
+def test_address_shared_by_open_deals_settles_one(database, monkeypatch):
+    confirmed = TxRef(tx_hash=TX_HASH, value=0.0102, confirmations=6, block_height=800000, seen_at=utc_timestamp())
+    settled, _, _, _ = run_callback(database, monkeypatch, provider_txs=[confirmed], deal_ids=("HOOK01", "HOOK02"))
+    assert len(settled) == 1
+
+
+def test_callback_route_checks_path_secret(database, monkeypatch):
+    (status, _), _, lookups, stats = run_callback(
+        database, monkeypatch, provider_txs=[], push=post(json.dumps(pushed_tx()), secret="wrong")
+    )
+    assert status == 403
+    assert lookups == []
+    assert stats["callbacks"] == 0
+
+
+@pytest.mark.parametrize("body", ["{not json", "[]", json.dumps({"outputs": []})])
+def test_callback_route_rejects_malformed_bodies(database, monkeypatch, body):
+    (status, _), _, lookups, stats = run_callback(database, monkeypatch, provider_txs=[], push=post(body))
+    assert status == 400
+    assert lookups == []
+    assert stats["callbacks"] == 0
+
+
+def test_callback_route_ignores_unknown_address(database, monkeypatch):
+    tx = pushed_tx()
+    tx["outputs"][0]["addresses"] = ["1BoatSLRHtKNngkdXEeobR76b53LETtpyT"]
+    (status, text), _, lookups, stats = run_callback(
+        database, monkeypatch, provider_txs=[], push=post(json.dumps(tx))
+    )
+    assert status == 200
+    assert json.loads(text) == {"settled": []}
+    assert lookups == []
+    assert stats["ignored"] == 1
+
+
+def test_callback_route_settles_after_provider_confirms(database, monkeypatch):
+    confirmed = TxRef(tx_hash=TX_HASH, value=0.0102, confirmations=6, block_height=800000, seen_at=utc_timestamp())
+    (status, text), ledger, _, stats = run_callback(
+        database, monkeypatch, provider_txs=[confirmed], push=post(json.dumps(pushed_tx()))
+    )
+    assert status == 200
+    assert json.loads(text) == {"settled": ["HOOK01"]}
+    assert ledger == [TX_HASH]
+    assert stats["settled"] == 1
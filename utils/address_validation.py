@@ -0,0 +1,105 @@
+import hashlib
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+BASE58_INDEX = {char: index for index, char in enumerate(BASE58_ALPHABET)}
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_INDEX = {char: index for index, char in enumerate(BECH32_CHARSET)}
+BECH32_CONST = 1
+BECH32M_CONST = 0x2BC830A3
+
+# Mainnet version bytes for base58check (P2PKH / P2SH) and bech32 prefixes
+NETWORKS = {
+    "BTC": {"base58_versions": {0x00, 0x05}, "hrp": "bc"},
+    "LTC": {"base58_versions": {0x30, 0x32, 0x05}, "hrp": "ltc"},
+}
+
+
+def _base58check_version(address: str):
+    """Returns the version byte of a valid base58check address, otherwise None"""
+    value = 0
+    for char in address:
+        if char not in BASE58_INDEX:
+            return None
+        value = value * 58 + BASE58_INDEX[char]
+
+    leading_zeros = len(address) - len(address.lstrip("1"))
+    raw = b"\x00" * leading_zeros + value.to_bytes((value.bit_length() + 7) // 8, "big")
+    if len(raw) != 25:
+        return None
+
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        return None
+    return payload[0]
+
+
+def _bech32_polymod(values) -> int:
+    generator = [0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3]
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1FFFFFF) << 5 ^ value
+        for i in range(5):
+            checksum ^= generator[i] if (top >> i) & 1 else 0
+    return checksum
+
+
+def _convert_bits(data, from_bits: int, to_bits: int):
+    accumulator = 0
+    bits = 0
+    result = []
+    max_value = (1 << to_bits) - 1
+    for value in data:
+        accumulator = (accumulator << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            result.append((accumulator >> bits) & max_value)
+    if bits >= from_bits or ((accumulator << (to_bits - bits)) & max_value):
+        return None
+    return result
+
+
+def _is_valid_segwit(address: str, hrp: str) -> bool:
+    if address.lower() != address and address.upper() != address:
+        return False
+    address = address.lower()
+
+    separator = address.rfind("1")
+    if separator < 1 or separator + 7 > len(address) or len(address) > 90:
+        return False
+    if address[:separator] != hrp:
+        return False
+
+    data = []
+    for char in address[separator + 1:]:
+        if char not in BECH32_INDEX:
+            return False
+        data.append(BECH32_INDEX[char])
+
+    expanded_hrp = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    const = _bech32_polymod(expanded_hrp + data)
+    if const not in (BECH32_CONST, BECH32M_CONST):
+        return False
+
+    witness_version = data[0]
+    program = _convert_bits(data[1:-6], 5, 8)
+    if witness_version > 16 or program is None or not 2 <= len(program) <= 40:
+        return False
+    if witness_version == 0:
+        return const == BECH32_CONST and len(program) in (20, 32)
+    return const == BECH32M_CONST
+
+
+def is_valid_address(crypto_type: str, address: str) -> bool:
+    """Checks base58check or bech32/bech32m checksum of a BTC/LTC mainnet address"""
+    network = NETWORKS.get(crypto_type)
+    if not network or not isinstance(address, str) or not address:
+        return False
+
+    # Base58 addresses may also start with "ltc1" in mixed case, so fall through on failure
+    if address.lower().startswith(network["hrp"] + "1") and _is_valid_segwit(address, network["hrp"]):
+        return True
+
+    return _base58check_version(address) in network["base58_versions"]
@@ -1,60 +1,778 @@
-import requests
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
 
-BLOCKCHAIN_APIS = {
-    "BTC": "https://api.blockcypher.com/v1/btc/main",
-    "LTC": "https://api.blockcypher.com/v1/ltc/main",
-    "ETH": "https://api.etherscan.io/api"
+import aiohttp
+
+from config import load_config
+from database.cache import TTLCache
+from database.db import get_address_transactions, get_scanned_height, record_address_scan
+from utils.http_client import get_json, request_json
+from utils.metrics import Histogram
+from utils.rate_limit import CircuitBreaker, Priority, RateLimiter, RateLimitExceeded, TokenBucket
+
+config = load_config()
+logger = logging.getLogger("escrow_bot")
+
+# Received amounts may differ from the expected one by rounding only
+AMOUNT_TOLERANCE = 0.000001
+
+# How long a 429 without Retry-After holds back requests to the provider
+DEFAULT_RETRY_AFTER = 60
+
+PROVIDER_REQUEST_SECONDS = Histogram(
+    "escrow_provider_request_seconds",
+    "Blockchain API request duration by provider and HTTP status",
+    ("provider", "status")
+)
+
+# How long callers may wait for a request slot before getting a rate limit error
+MAX_WAIT = {
+    Priority.INTERACTIVE: config.rate_limit_interactive_wait,
+    Priority.BACKGROUND: config.rate_limit_background_wait,
 }
 
-def check_transaction(crypto_type: str, address: str, expected_amount: float) -> dict:
+
+@dataclass(slots=True)
+class TxRef:
+    """A transaction paying into the checked address; block_height is -1 while unconfirmed"""
+    tx_hash: str
+    value: float
+    confirmations: int
+    block_height: int
+    seen_at: str
+
+
+def utc_timestamp(value=None) -> str:
+    """ISO 8601 string or unix time as UTC "YYYY-MM-DD HH:MM:SS", the format SQLite uses for created_at"""
+    if value is None:
+        moment = datetime.now(timezone.utc)
+    elif isinstance(value, (int, float)):
+        moment = datetime.fromtimestamp(value, timezone.utc)
+    else:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ProviderError(Exception):
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RateLimitedError(ProviderError):
+    pass
+
+
+class ProviderUnavailableError(ProviderError):
+    """The provider's circuit is open after repeated failures"""
+
+
+class LatencyTracker:
+    """Recent response times of a provider, used to decide when to hedge"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> float:
+        """None until enough samples have been collected"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class BlockchainProvider:
+    """Looks up incoming transactions of an address"""
+    name = "base"
+    currencies = ()
+    # Whether register_hook() can subscribe to payments instead of polling
+    supports_hooks = False
+    # Set up by get_provider() from PROVIDER_RATE_LIMITS and the circuit breaker settings
+    limiter = None
+    breaker = None
+    latency = None
+
+    async def get_address_txs(self, crypto_type: str, address: str, priority: int = Priority.INTERACTIVE,
+                              after_height: int = 0) -> list:
+        """Returns TxRefs paying into `address`; raises ProviderError.
+
+        after_height lets the provider skip older blocks, callers must still filter the result.
+        """
+        raise NotImplementedError
+
+    async def register_hook(self, crypto_type: str, address: str, url: str, confirmations: int) -> str:
+        """Subscribes `url` to transactions of `address`, returns the hook id"""
+        raise NotImplementedError
+
+    async def unregister_hook(self, crypto_type: str, hook_id: str):
+        raise NotImplementedError
+
+    async def _acquire(self, priority: int, tokens: int = 1):
+        if self.breaker and not self.breaker.allow():
+            retry_after = self.breaker.retry_after()
+            raise ProviderUnavailableError(
+                f"Blockchain API ({self.name}) is temporarily unavailable. Try again in {retry_after:.0f} s.",
+                retry_after=retry_after
+            )
+        if self.limiter:
+            try:
+                await self.limiter.acquire(priority, MAX_WAIT.get(priority), tokens)
+            except RateLimitExceeded as e:
+                raise RateLimitedError(
+                    f"API request limit reached. Try again in {e.retry_after:.0f} s.",
+                    retry_after=e.retry_after
+                ) from None
+
+    async def _get(self, url: str, params: dict, timeout: float, priority: int = Priority.INTERACTIVE,
+                   tokens: int = 1) -> dict:
+        """GETs a provider resource; `tokens` is the request's cost against the provider's quota"""
+        # A 429 with a short Retry-After is retried once after waiting it out
+        for attempt in range(2):
+            await self._acquire(priority, tokens)
+            started = time.perf_counter()
+            try:
+                status, data, headers = await get_json(url, params=params, timeout=timeout)
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                PROVIDER_REQUEST_SECONDS.observe(time.perf_counter() - started, self.name, outcome)
+                if self.breaker:
+                    self.breaker.record_failure()
+                raise
+            PROVIDER_REQUEST_SECONDS.observe(time.perf_counter() - started, self.name, str(status))
+
+            if self.breaker:
+                if status >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+
+            if status != 429:
+                break
+
+            retry_after = headers.get("Retry-After")
+            retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+            if self.limiter:
+                self.limiter.block(retry_after if retry_after is not None else DEFAULT_RETRY_AFTER)
+            if attempt == 0 and retry_after is not None and retry_after <= MAX_WAIT.get(priority, 0):
+                continue
+            raise RateLimitedError(
+                "API request limit exceeded. Try again in 1 minute.",
+                status=status,
+                retry_after=retry_after
+            )
+
+        if status != 200:
+            error_msg = data.get("error", "Unknown API error") if isinstance(data, dict) else f"HTTP error {status}"
+            raise ProviderError(f"API error ({status}): {error_msg}", status=status)
+
+        if not isinstance(data, (dict, list)):
+            raise ProviderError("Blockchain response processing error: invalid JSON", status=status)
+
+        return data
+
+
+class BlockCypherProvider(BlockchainProvider):
+    """BlockCypher API; concurrent lookups are batched into one `addrs/A;B;C` call per currency"""
+    name = "blockcypher"
+    currencies = ("BTC", "LTC")
+    supports_hooks = True
+
+    def __init__(self, base_url: str, token: str = "", limit: int = 50, timeout: float = 15,
+                 batch_size: int = 1, batch_window: float = 0.05):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.limit = limit
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self._pending = {}
+        self._pending_priority = {}
+        self._pending_after = {}
+        self._flush_handles = {}
+        # In-flight batch task -> the callers' futures it answers
+        self._batches = {}
+        self.stats = {"lookups": 0, "requests": 0}
+
+    def address_url(self, crypto_type: str, address: str) -> str:
+        return f"{self.base_url}/{crypto_type.lower()}/main/addrs/{address}"
+
+    def params(self, after_height: int = 0) -> dict:
+        params = {"limit": self.limit}
+        if after_height > 0:
+            params["after"] = after_height
+        if self.token:
+            params["token"] = self.token
+        return params
+
+    async def get_address_txs(self, crypto_type: str, address: str, priority: int = Priority.INTERACTIVE,
+                              after_height: int = 0) -> list:
+        self.stats["lookups"] += 1
+        if self.batch_size == 1:
+            self.stats["requests"] += 1
+            data = await self._get(
+                self.address_url(crypto_type, address), self.params(after_height), self.timeout, priority
+            )
+            return self.parse_address(data, crypto_type)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Callers asking for the same address share one slot in the batch
+        pending = self._pending.setdefault(crypto_type, {})
+        pending.setdefault(address, []).append(future)
+        # The batch goes out in the most urgent lane of its callers, from the lowest cursor
+        self._pending_priority[crypto_type] = min(priority, self._pending_priority.get(crypto_type, priority))
+        self._pending_after[crypto_type] = min(after_height, self._pending_after.get(crypto_type, after_height))
+
+        if len(pending) >= self.batch_size:
+            self._flush(crypto_type)
+        elif crypto_type not in self._flush_handles:
+            self._flush_handles[crypto_type] = loop.call_later(self.batch_window, self._flush, crypto_type)
+
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # E.g. the losing side of a hedged request
+            self._withdraw(crypto_type, address, future)
+            raise
+
+    def _withdraw(self, crypto_type: str, address: str, future):
+        """Drops a cancelled caller: its address leaves a batch not sent yet once nobody waits for it,
+        and a sent batch nobody waits for any more is cancelled, giving back its queued limiter slot"""
+        pending = self._pending.get(crypto_type)
+        if pending is not None and future in pending.get(address, ()):
+            pending[address].remove(future)
+            if not pending[address]:
+                del pending[address]
+            if not pending:
+                handle = self._flush_handles.pop(crypto_type, None)
+                if handle:
+                    handle.cancel()
+                del self._pending[crypto_type]
+                self._pending_priority.pop(crypto_type, None)
+                self._pending_after.pop(crypto_type, None)
+            return
+
+        for task, batch in self._batches.items():
+            if future in batch.get(address, ()):
+                if all(waiting.done() for futures in batch.values() for waiting in futures):
+                    task.cancel()
+                return
+
+    def _flush(self, crypto_type: str):
+        handle = self._flush_handles.pop(crypto_type, None)
+        if handle:
+            handle.cancel()
+        pending = self._pending.pop(crypto_type, None)
+        priority = self._pending_priority.pop(crypto_type, Priority.INTERACTIVE)
+        after_height = self._pending_after.pop(crypto_type, 0)
+        if not pending:
+            return
+
+        task = asyncio.create_task(self._fetch_batch(crypto_type, pending, priority, after_height))
+        self._batches[task] = pending
+        task.add_done_callback(lambda done: self._batches.pop(done, None))
+
+    async def _fetch_batch(self, crypto_type: str, pending: dict, priority: int, after_height: int):
+        addresses = list(pending)
+        self.stats["requests"] += 1
+        try:
+            # BlockCypher counts every address of a batch against the quota
+            data = await self._get(
+                self.address_url(crypto_type, ";".join(addresses)), self.params(after_height), self.timeout, priority,
+                tokens=len(addresses)
+            )
+        except Exception as e:
+            # Rate limits, timeouts and connection errors reach every waiting caller
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        # A single address comes back as an object, several as a list of objects
+        items = data if isinstance(data, list) else [data]
+        by_address = {}
+        for item in items:
+            if isinstance(item, dict) and item.get("address"):
+                by_address[item["address"]] = item
+                # bech32 addresses may be echoed back lowercased
+                by_address.setdefault(item["address"].lower(), item)
+
+        for address, futures in pending.items():
+            item = by_address.get(address) or by_address.get(address.lower())
+            if item is None and len(addresses) == 1 and isinstance(data, dict):
+                item = data
+
+            if item is None or "error" in item:
+                error = item.get("error") if item else "address missing from batch response"
+                result, exception = None, ProviderError(f"API error: {error}")
+            else:
+                result, exception = self.parse_address(item, crypto_type), None
+
+            for future in futures:
+                if future.done():
+                    continue
+                if exception:
+                    future.set_exception(exception)
+                else:
+                    future.set_result(result)
+
+    def hooks_url(self, crypto_type: str) -> str:
+        return f"{self.base_url}/{crypto_type.lower()}/main/hooks"
+
+    async def register_hook(self, crypto_type: str, address: str, url: str, confirmations: int) -> str:
+        if not self.token:
+            raise ProviderError("BlockCypher webhooks need BLOCKCYPHER_API_KEY")
+        await self._acquire(Priority.BACKGROUND)
+        status, data, _ = await request_json(
+            "POST",
+            self.hooks_url(crypto_type),
+            params={"token": self.token},
+            json_body={"event": "tx-confirmation", "address": address, "url": url, "confirmations": confirmations},
+            timeout=self.timeout
+        )
+        if status not in (200, 201) or not isinstance(data, dict) or "id" not in data:
+            error_msg = data.get("error", "Unknown API error") if isinstance(data, dict) else f"HTTP error {status}"
+            raise ProviderError(f"Hook registration failed ({status}): {error_msg}", status=status)
+        return data["id"]
+
+    async def unregister_hook(self, crypto_type: str, hook_id: str):
+        await self._acquire(Priority.BACKGROUND)
+        status, data, _ = await request_json(
+            "DELETE", f"{self.hooks_url(crypto_type)}/{hook_id}", params={"token": self.token}, timeout=self.timeout
+        )
+        # 404: already gone, e.g. expired on the provider side
+        if status not in (200, 204, 404):
+            raise ProviderError(f"Hook removal failed ({status})", status=status)
+
+    @staticmethod
+    def parse_output_values(tx: dict, addresses) -> dict:
+        """Sums a webhook TX payload's outputs per address in `addresses`"""
+        values = {}
+        for output in tx.get("outputs", []):
+            for address in output.get("addresses") or []:
+                if address in addresses:
+                    values[address] = values.get(address, 0) + output.get("value", 0) / 1e8
+        return values
+
+    @staticmethod
+    def parse_address(data: dict, crypto_type: str) -> list:
+        # Confirmed and mempool refs; one tx may pay the address through several outputs
+        refs = data.get("txrefs", []) + data.get("unconfirmed_txrefs", [])
+        txs = {}
+        for ref in refs:
+            if ref.get("tx_input_n", -1) != -1:
+                continue  # spending from the address, not paying into it
+
+            tx_hash = ref.get("tx_hash", "unknown")
+            tx = txs.get(tx_hash)
+            if tx is None:
+                txs[tx_hash] = TxRef(
+                    tx_hash=tx_hash,
+                    value=ref.get("value", 0) / 1e8,
+                    confirmations=ref.get("confirmations", 0),
+                    block_height=ref.get("block_height", -1),
+                    seen_at=utc_timestamp(ref.get("received") or ref.get("confirmed"))
+                )
+            else:
+                tx.value += ref.get("value", 0) / 1e8
+
+        return list(txs.values())
+
+
+class EtherscanProvider(BlockchainProvider):
+    name = "etherscan"
+    currencies = ("ETH",)
+
+    def __init__(self, base_url: str, api_key: str = "", timeout: float = 10):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+
+    async def get_address_txs(self, crypto_type: str, address: str, priority: int = Priority.INTERACTIVE,
+                              after_height: int = 0) -> list:
+        params = {
+            "module": "account",
+            "action": "txlist",
+            "address": address,
+            "startblock": after_height + 1 if after_height > 0 else 0,
+            "endblock": 99999999,
+            "sort": "desc"
+        }
+        if self.api_key:
+            params["apikey"] = self.api_key
+
+        data = await self._get(self.base_url, params, self.timeout, priority)
+        # status "0" with "No transactions found" is an empty result, not an error
+        if data.get("status") != "1":
+            if isinstance(data.get("result"), list):
+                return []
+            raise ProviderError(f"API error: {data.get('result') or data.get('message')}")
+
+        return [
+            TxRef(
+                tx_hash=tx["hash"],
+                value=int(tx["value"]) / 1e18,
+                confirmations=int(tx["confirmations"]),
+                block_height=int(tx["blockNumber"]),
+                seen_at=utc_timestamp(int(tx["timeStamp"]))
+            )
+            for tx in data["result"]
+            if tx.get("to", "").lower() == address.lower()
+        ]
+
+
+class EsploraProvider(BlockchainProvider):
+    """Esplora REST API (Blockstream for BTC, litecoinspace for LTC); keyless, used as fallback"""
+    name = "esplora"
+    currencies = ("BTC", "LTC")
+
+    def __init__(self, base_urls: dict, timeout: float = 15):
+        self.base_urls = {crypto_type: url.rstrip("/") for crypto_type, url in base_urls.items()}
+        self.timeout = timeout
+
+    async def get_address_txs(self, crypto_type: str, address: str, priority: int = Priority.INTERACTIVE,
+                              after_height: int = 0) -> list:
+        base_url = self.base_urls.get(crypto_type)
+        if not base_url:
+            raise ProviderError(f"Unsupported cryptocurrency: {crypto_type}")
+
+        # Newest 25 txs (mempool first) plus the chain tip for confirmation counts
+        txs = await self._get(f"{base_url}/address/{address}/txs", None, self.timeout, priority)
+        blocks = await self._get(f"{base_url}/blocks", None, self.timeout, priority)
+        if not isinstance(txs, list) or not isinstance(blocks, list) or not blocks:
+            raise ProviderError("Blockchain response processing error: unexpected Esplora response")
+        return self.parse_txs(txs, address, blocks[0]["height"])
+
+    @staticmethod
+    def parse_txs(txs: list, address: str, tip_height: int) -> list:
+        refs = []
+        for tx in txs:
+            value = sum(vout.get("value", 0) for vout in tx.get("vout", []) if vout.get("scriptpubkey_address") == address)
+            if not value:
+                continue  # spending from the address, not paying into it
+
+            status = tx.get("status", {})
+            if status.get("confirmed"):
+                block_height = status["block_height"]
+                refs.append(TxRef(
+                    tx_hash=tx["txid"],
+                    value=value / 1e8,
+                    confirmations=tip_height - block_height + 1,
+                    block_height=block_height,
+                    seen_at=utc_timestamp(status.get("block_time"))
+                ))
+            else:
+                refs.append(TxRef(tx_hash=tx["txid"], value=value / 1e8, confirmations=0, block_height=-1,
+                                  seen_at=utc_timestamp()))
+        return refs
+
+
+PROVIDER_FACTORIES = {
+    "blockcypher": lambda: BlockCypherProvider(
+        config.blockcypher_base_url,
+        config.blockcypher_api_key,
+        batch_size=config.blockcypher_batch_size,
+        batch_window=config.blockcypher_batch_window_ms / 1000
+    ),
+    "etherscan": lambda: EtherscanProvider(config.etherscan_base_url, config.etherscan_api_key),
+    "esplora": lambda: EsploraProvider(config.esplora_base_urls),
+}
+
+_providers = {}
+
+
+def get_provider(crypto_type: str) -> BlockchainProvider:
+    """Provider configured for a currency (BLOCKCHAIN_PROVIDERS), created once"""
+    name = config.blockchain_providers.get(crypto_type)
+    if name not in PROVIDER_FACTORIES:
+        raise ProviderError(f"Unsupported cryptocurrency: {crypto_type}")
+    return _provider_by_name(name)
+
+
+def get_fallback_provider(crypto_type: str) -> BlockchainProvider:
+    """Second provider for a currency (BLOCKCHAIN_FALLBACK_PROVIDERS), None if there is none"""
+    name = config.blockchain_fallback_providers.get(crypto_type)
+    if name not in PROVIDER_FACTORIES or name == config.blockchain_providers.get(crypto_type):
+        return None
+    return _provider_by_name(name)
+
+
+def _provider_by_name(name: str) -> BlockchainProvider:
+    if name not in _providers:
+        provider = PROVIDER_FACTORIES[name]()
+        provider.limiter = build_limiter(name)
+        provider.breaker = CircuitBreaker(
+            name,
+            failure_threshold=config.circuit_failure_threshold,
+            reset_timeout=config.circuit_reset_timeout
+        )
+        provider.latency = LatencyTracker()
+        _providers[name] = provider
+    return _providers[name]
+
+
+def build_limiter(name: str) -> RateLimiter:
+    """Per-second and per-hour buckets from PROVIDER_RATE_LIMITS ("name=per_second/per_hour")"""
+    limits = config.provider_rate_limits.get(name)
+    if not limits:
+        return None
+    per_second, per_hour = (float(value) for value in limits.split("/"))
+    return RateLimiter([
+        TokenBucket(per_second, max(1.0, per_second)),
+        TokenBucket(per_hour / 3600, per_hour),
+    ])
+
+
+def provider_stats() -> dict:
+    return {
+        name: {
+            **getattr(provider, "stats", {}),
+            **(provider.limiter.stats if provider.limiter else {}),
+            "circuit_open": provider.breaker.is_open,
+            "latency_p95": provider.latency.percentile(95),
+        }
+        for name, provider in _providers.items()
+    }
+
+
+_hedge_stats = {"hedged": 0, "hedge_wins": 0, "failovers": 0, "disagreements": 0}
+
+
+def hedge_stats() -> dict:
+    return dict(_hedge_stats)
+
+
+def _hedge_delay(provider: BlockchainProvider) -> float:
+    delay = provider.latency.percentile(config.hedge_percentile)
+    if delay is None:
+        delay = config.hedge_default_delay_ms / 1000
+    return max(config.hedge_min_delay_ms / 1000, delay)
+
+
+async def _timed_fetch(provider, crypto_type: str, address: str, priority: int, after_height: int) -> list:
+    started = time.perf_counter()
+    txs = await provider.get_address_txs(crypto_type, address, priority, after_height)
+    provider.latency.add(time.perf_counter() - started)
+    return txs
+
+
+def reconcile(crypto_type: str, primary_txs: list, secondary_txs: list) -> list:
+    """Merges two providers' answers; for txs both report, the lower amount and confirmation count win"""
+    secondary = {tx.tx_hash: tx for tx in secondary_txs}
+    merged = []
+    for tx in primary_txs:
+        other = secondary.pop(tx.tx_hash, None)
+        if other is not None:
+            if abs(tx.value - other.value) > AMOUNT_TOLERANCE:
+                _hedge_stats["disagreements"] += 1
+                logger.warning(
+                    f"⚠️ Providers disagree on {crypto_type} tx {tx.tx_hash}: {tx.value} vs {other.value}"
+                )
+            tx = TxRef(
+                tx_hash=tx.tx_hash,
+                value=min(tx.value, other.value),
+                confirmations=min(tx.confirmations, other.confirmations),
+                block_height=tx.block_height,
+                seen_at=min(tx.seen_at, other.seen_at)
+            )
+        merged.append(tx)
+    return merged + list(secondary.values())
+
+
+async def fetch_address_txs(crypto_type: str, address: str, priority: int = Priority.INTERACTIVE,
+                            after_height: int = 0) -> list:
+    """Address transactions from the primary provider, with the fallback provider as backup.
+
+    Errors fail over to the fallback. Interactive lookups that take longer than the primary's
+    HEDGE_PERCENTILE latency also send a hedged request to the fallback; the first valid answer
+    wins and the other request is cancelled.
+    """
+    primary = get_provider(crypto_type)
+    fallback = get_fallback_provider(crypto_type)
+    if fallback is None:
+        return await _timed_fetch(primary, crypto_type, address, priority, after_height)
+
+    first = asyncio.create_task(_timed_fetch(primary, crypto_type, address, priority, after_height))
+    second = None
     try:
-        if crypto_type in ["BTC", "LTC"]:
-            url = f"{BLOCKCHAIN_APIS[crypto_type]}/addrs/{address}/full?limit=50"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            for tx in data.get("txs", []):
-                if tx.get("confirmations", 0) >= 3:
-                    received = sum(
-                        output["value"] for output in tx["outputs"]
-                        if any(addr == address for addr in output["addresses"])
-                    ) / 1e8
-                    
-                    if received >= expected_amount:
-                        return {
-                            "confirmed": True,
-                            "tx_hash": tx["hash"],
-                            "amount": received,
-                            "confirmations": tx["confirmations"]
-                        }
-        
-        elif crypto_type == "ETH":
-            # For ETH, Etherscan API key is required (add to .env if needed)
-            params = {
-                "module": "account",
-                "action": "txlist",
-                "address": address,
-                "startblock": 0,
-                "endblock": 99999999,
-                "sort": "desc"
+        hedge = config.hedge_requests and priority == Priority.INTERACTIVE
+        await asyncio.wait({first}, timeout=_hedge_delay(primary) if hedge else None)
+
+        if first.done():
+            if first.exception() is None:
+                return first.result()
+            _hedge_stats["failovers"] += 1
+            logger.warning(f"⚠️ {primary.name} failed ({first.exception()!r}), failing over to {fallback.name}")
+            return await _timed_fetch(fallback, crypto_type, address, priority, after_height)
+
+        _hedge_stats["hedged"] += 1
+        second = asyncio.create_task(_timed_fetch(fallback, crypto_type, address, priority, after_height))
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            answers = {task: task.result() for task in done if task.exception() is None}
+            if len(answers) == 2:
+                return reconcile(crypto_type, answers[first], answers[second])
+            if answers:
+                if second in answers:
+                    _hedge_stats["hedge_wins"] += 1
+                return next(iter(answers.values()))
+
+        # Both failed: report the primary's error
+        raise first.exception()
+    finally:
+        for task in (first, second):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+_address_cache = TTLCache(config.address_cache_size, config.address_cache_pending_ttl)
+_in_flight = {}
+_coalesced = 0
+
+
+def _address_cache_ttl(crypto_type: str, txs: list) -> float:
+    # Confirmed payments don't change; missing or unconfirmed ones may appear any moment
+    min_confirmations = config.min_confirmations[crypto_type]
+    if any(tx.confirmations >= min_confirmations for tx in txs):
+        return config.address_cache_confirmed_ttl
+    return config.address_cache_pending_ttl
+
+
+async def _scan_address(crypto_type: str, address: str, priority: int) -> list:
+    # Only blocks above the cursor are fetched; below it everything is final and in the ledger
+    scanned_height = await get_scanned_height(address)
+    txs = await fetch_address_txs(crypto_type, address, priority, scanned_height)
+    txs = [tx for tx in txs if tx.block_height < 0 or tx.block_height > scanned_height]
+
+    # Deeper blocks have more confirmations, so everything up to the highest final tx is final too
+    min_confirmations = config.min_confirmations[crypto_type]
+    final_heights = [tx.block_height for tx in txs if tx.confirmations >= min_confirmations and tx.block_height > 0]
+    await record_address_scan(crypto_type, address, txs, max(final_heights, default=scanned_height))
+
+    _address_cache.set((crypto_type, address), txs, ttl=_address_cache_ttl(crypto_type, txs))
+    return txs
+
+
+def _forget_in_flight(key, task):
+    if _in_flight.get(key, (None,))[0] is task:
+        del _in_flight[key]
+    if not task.cancelled():
+        task.exception()  # retrieved by the waiting callers, if any are left
+
+
+async def get_address_txs(crypto_type: str, address: str, priority: int = Priority.INTERACTIVE) -> list:
+    """New transactions of an address (recorded in the ledger) from the cache,
+    or one provider scan shared by concurrent callers of the same or a lower priority"""
+    global _coalesced
+    key = (crypto_type, address)
+    txs = _address_cache.get(key)
+    if txs is not None:
+        return txs
+
+    task, task_priority = _in_flight.get(key, (None, None))
+    if task is None or task_priority > priority:
+        # An admin check doesn't queue behind a watcher scan in the background lane; later
+        # callers join the more urgent scan
+        task = asyncio.create_task(_scan_address(crypto_type, address, priority))
+        _in_flight[key] = (task, priority)
+        task.add_done_callback(lambda done: _forget_in_flight(key, done))
+    else:
+        _coalesced += 1
+
+    # A cancelled caller must not cancel the lookup others are waiting for
+    return await asyncio.shield(task)
+
+
+def forget_address(crypto_type: str, address: str):
+    """Drops a cached lookup so the next one asks the provider"""
+    _address_cache.pop((crypto_type, address))
+
+
+def address_cache_stats() -> dict:
+    return {**_address_cache.stats(), "coalesced": _coalesced, "in_flight": len(_in_flight)}
+
+
+def evaluate_payment(crypto_type: str, txs: list, expected_amount: float) -> dict:
+    """Applies the currency's confirmation policy to the address's ledger transactions"""
+    min_confirmations = config.min_confirmations[crypto_type]
+
+    if not txs:
+        return {"confirmed": False, "error": "No transactions found for this address while the deal was open"}
+
+    for tx in txs:
+        if tx.confirmations >= min_confirmations and tx.value >= expected_amount - AMOUNT_TOLERANCE:
+            return {
+                "confirmed": True,
+                "tx_hash": tx.tx_hash,
+                "amount": tx.value,
+                "confirmations": tx.confirmations,
+                "timestamp": tx.seen_at
             }
-            response = requests.get(BLOCKCHAIN_APIS["ETH"], params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get("status") == "1":
-                for tx in data["result"]:
-                    if int(tx["confirmations"]) >= 12:
-                        value = int(tx["value"]) / 1e18
-                        if value >= expected_amount:
-                            return {
-                                "confirmed": True,
-                                "tx_hash": tx["hash"],
-                                "amount": value,
-                                "confirmations": int(tx["confirmations"])
-                            }
-        
-        return {"confirmed": False}
+
+    total_received = sum(tx.value for tx in txs)
+
+    error_details = (
+        f"Required amount: {expected_amount} {crypto_type}\n"
+        f"Received: {total_received} {crypto_type}\n"
+        f"Min. confirmations: {min_confirmations}\n\n"
+        f"Transaction details:\n"
+    )
+
+    for i, tx in enumerate(txs[:3], 1):
+        error_details += f"{i}. {tx.tx_hash[:10]}... | {tx.value} {crypto_type} | {tx.confirmations} conf.\n"
+
+    if len(txs) > 3:
+        error_details += f"+ {len(txs) - 3} more transactions"
+
+    return {"confirmed": False, "error": error_details}
+
+
+async def check_transaction(crypto_type: str, address: str, expected_amount: float,
+                            priority: int = Priority.INTERACTIVE, since: str = None, until: str = None) -> dict:
+    """Checks whether `address` received `expected_amount` with enough confirmations.
+
+    Only transactions first seen in [`since`, `until`) count (see deal_payment_window()), so payments
+    for an earlier or a later deal on the same address are ignored. Admin checks run in the interactive
+    lane, the payment watcher passes Priority.BACKGROUND.
+    """
+    try:
+        provider = get_provider(crypto_type)
+
+        logger.info(f"🔍 Checking transaction for {crypto_type} address: {address} via {provider.name}")
+        new_txs = await get_address_txs(crypto_type, address, priority)
+        txs = await get_address_transactions(crypto_type, address, since, until)
+        logger.info(f"📊 Found transactions: {len(txs)} ({len(new_txs)} new or unconfirmed)")
+
+        return evaluate_payment(crypto_type, txs, expected_amount)
+
+    except RateLimitedError as e:
+        return {"confirmed": False, "error": str(e), "rate_limited": True, "retry_after": e.retry_after}
+    except ProviderUnavailableError as e:
+        logger.warning(f"⚠️ {str(e)}")
+        return {"confirmed": False, "error": str(e), "retry_after": e.retry_after}
+    except ProviderError as e:
+        logger.error(f"❌ Blockchain provider error: {str(e)}")
+        return {"confirmed": False, "error": str(e)}
+    except asyncio.TimeoutError:
+        logger.error("❌ Timeout when requesting blockchain API")
+        return {"confirmed": False, "error": "Timeout when requesting blockchain. Please try again later."}
+    except aiohttp.ClientError:
+        logger.error("❌ Connection error to blockchain API")
+        return {"confirmed": False, "error": "Connection error to blockchain. Check your internet connection."}
     except Exception as e:
-        return {"confirmed": False, "error": str(e)}
\ No newline at end of file
+        logger.exception(f"❌ Critical error in check_transaction: {str(e)}")
+        return {"confirmed": False, "error": f"Internal system error: {str(e)}"}
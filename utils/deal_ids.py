@@ -0,0 +1,57 @@
+import hashlib
+
+DEAL_ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+DEAL_ID_INDEX = {char: index for index, char in enumerate(DEAL_ID_ALPHABET)}
+DEAL_ID_LENGTH = 6
+
+# 36^6 = 46656^2: an ID is a pair of 3-character halves, which the Feistel rounds mix
+HALF_SPACE = len(DEAL_ID_ALPHABET) ** (DEAL_ID_LENGTH // 2)
+DEAL_ID_SPACE = HALF_SPACE * HALF_SPACE
+
+FEISTEL_ROUNDS = 4
+
+
+def _round(value: int, key: int) -> int:
+    x = ((value * 0x9E3779B1) ^ key) & 0xFFFFFFFF
+    x ^= x >> 15
+    x = (x * 0x2C1B3C6D) & 0xFFFFFFFF
+    x ^= x >> 12
+    return x % HALF_SPACE
+
+
+class DealIdPermutation:
+    """Keyed bijection between counter values in [0, DEAL_ID_SPACE) and 6-character deal IDs.
+
+    Distinct counters always give distinct IDs, and consecutive counters give unrelated-looking ones.
+    Obfuscation only: with enough IDs the key can be recovered, so IDs must not act as secrets.
+    """
+
+    def __init__(self, key: bytes):
+        digest = hashlib.blake2b(key, digest_size=4 * FEISTEL_ROUNDS, person=b"deal-id").digest()
+        self._keys = [int.from_bytes(digest[i:i + 4], "little") for i in range(0, len(digest), 4)]
+
+    def encode(self, counter: int) -> str:
+        if not 0 <= counter < DEAL_ID_SPACE:
+            raise ValueError(f"Deal ID counter out of range: {counter}")
+
+        left, right = divmod(counter, HALF_SPACE)
+        for key in self._keys:
+            left, right = right, (left + _round(right, key)) % HALF_SPACE
+
+        value = left * HALF_SPACE + right
+        chars = []
+        for _ in range(DEAL_ID_LENGTH):
+            value, digit = divmod(value, len(DEAL_ID_ALPHABET))
+            chars.append(DEAL_ID_ALPHABET[digit])
+        return "".join(reversed(chars))
+
+    def decode(self, deal_id: str) -> int:
+        """The counter a deal ID was made from"""
+        value = 0
+        for char in deal_id:
+            value = value * len(DEAL_ID_ALPHABET) + DEAL_ID_INDEX[char]
+
+        left, right = divmod(value, HALF_SPACE)
+        for key in reversed(self._keys):
+            left, right = (right - _round(left, key)) % HALF_SPACE, left
+        return left * HALF_SPACE + right
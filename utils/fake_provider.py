@@ -0,0 +1,198 @@
+"""Local HTTP server replaying recorded blockchain API responses.
+
+Each *.json file in the fixtures directory holds one fixture or a list of them:
+
+    {
+        "path": "/btc/main/addrs/1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa",
+        "query": {"module": "account"},
+        "responses": [
+            {"status": 429, "headers": {"Retry-After": "2"}, "body": {"error": "Limits reached"}},
+            {"status": 200, "delay": 0.3, "body": {"txrefs": []}}
+        ]
+    }
+
+"query" is optional and matched as a subset of the request's query string. Responses are
+served in order and the last one repeats. "delay" is seconds or a latency distribution:
+{"distribution": "lognormal", "median": 0.1, "sigma": 1.0} or
+{"distribution": "uniform", "min": 0, "max": 1}.
+
+Batched `addrs/A;B;C` calls are assembled from the single-address fixtures. Unless a fixture
+matches, BlockCypher hook registration (POST .../hooks, DELETE .../hooks/<id>) is emulated in
+memory. With --record, unmatched requests are forwarded to the upstream API and the answer is
+saved as a new fixture.
+
+Usage: python -m utils.fake_provider --fixtures fixtures/ [--port 8088] [--record https://api.blockcypher.com/v1]
+Then point BLOCKCYPHER_BASE_URL / ETHERSCAN_BASE_URL / ESPLORA_BASE_URLS at http://127.0.0.1:8088
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+import sys
+import uuid
+from pathlib import Path
+
+from aiohttp import web
+
+logger = logging.getLogger("escrow_bot")
+
+# Query parameters that never take part in matching or get recorded
+IGNORED_PARAMS = {"token", "apikey"}
+
+
+def sample_delay(spec) -> float:
+    if not spec:
+        return 0
+    if isinstance(spec, (int, float)):
+        return spec
+    if spec["distribution"] == "lognormal":
+        return random.lognormvariate(math.log(spec["median"]), spec["sigma"])
+    if spec["distribution"] == "uniform":
+        return random.uniform(spec["min"], spec["max"])
+    raise ValueError(f"Unknown delay distribution: {spec['distribution']}")
+
+
+class FakeProvider:
+    def __init__(self, fixtures_dir: Path, record_upstream: str = None):
+        self.fixtures_dir = Path(fixtures_dir)
+        self.record_upstream = record_upstream.rstrip("/") if record_upstream else None
+        self.fixtures = []
+        self.requests = 0
+        self.hooks = {}
+
+    def load(self):
+        """(Re)reads all fixture files and resets response sequences"""
+        self.fixtures = []
+        for path in sorted(self.fixtures_dir.glob("*.json")):
+            with open(path) as f:
+                data = json.load(f)
+            for fixture in data if isinstance(data, list) else [data]:
+                fixture["served"] = 0
+                self.fixtures.append(fixture)
+        logger.info(f"✅ Fake provider loaded {len(self.fixtures)} fixtures from {self.fixtures_dir}")
+
+    def add_fixture(self, path: str, responses: list, query: dict = None):
+        """Registers a fixture in memory, e.g. from a load test script"""
+        fixture = {"path": path, "query": query or {}, "responses": responses, "served": 0}
+        self.fixtures.append(fixture)
+        return fixture
+
+    def match(self, path: str, query: dict):
+        for fixture in self.fixtures:
+            if fixture["path"] != path:
+                continue
+            expected = fixture.get("query") or {}
+            if all(query.get(key) == str(value) for key, value in expected.items()):
+                return fixture
+        return None
+
+    async def respond(self, fixture: dict) -> web.Response:
+        responses = fixture["responses"]
+        response = responses[min(fixture["served"], len(responses) - 1)]
+        fixture["served"] += 1
+
+        delay = sample_delay(response.get("delay"))
+        if delay:
+            await asyncio.sleep(delay)
+
+        return web.json_response(
+            response.get("body"),
+            status=response.get("status", 200),
+            headers=response.get("headers")
+        )
+
+    async def respond_batch(self, path: str, query: dict) -> web.Response:
+        """Answers a BlockCypher `addrs/A;B;C` call from the single-address fixtures"""
+        prefix, _, joined = path.rpartition("/")
+        items, delay = [], 0
+        for address in joined.split(";"):
+            fixture = self.match(f"{prefix}/{address}", query)
+            if fixture is None:
+                items.append({"address": address, "error": f"No fixture for {prefix}/{address}"})
+                continue
+
+            responses = fixture["responses"]
+            response = responses[min(fixture["served"], len(responses) - 1)]
+            fixture["served"] += 1
+            delay = max(delay, sample_delay(response.get("delay")))
+            if response.get("status", 200) != 200:
+                # A 429 or server error fails the whole batch
+                return await self.respond({"responses": [response], "served": 0})
+            items.append({"address": address, **(response.get("body") or {})})
+
+        if delay:
+            await asyncio.sleep(delay)
+        return web.json_response(items)
+
+    async def respond_hooks(self, request: web.Request) -> web.Response:
+        if request.method == "POST" and request.path.endswith("/hooks"):
+            hook = {**await request.json(), "id": str(uuid.uuid4())}
+            self.hooks[hook["id"]] = hook
+            return web.json_response(hook, status=201)
+        if request.method == "DELETE":
+            hook = self.hooks.pop(request.path.rsplit("/", 1)[1], None)
+            return web.Response(status=204 if hook else 404)
+        if request.method == "GET":
+            return web.json_response(list(self.hooks.values()))
+        return web.Response(status=405)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        query = {key: value for key, value in request.query.items() if key not in IGNORED_PARAMS}
+
+        fixture = self.match(request.path, query)
+        if fixture is None and ";" in request.path:
+            return await self.respond_batch(request.path, query)
+        if fixture is None and "/hooks" in request.path:
+            return await self.respond_hooks(request)
+        if fixture is None and self.record_upstream:
+            fixture = await self.record(request.path, dict(request.query), query)
+        if fixture is None:
+            return web.json_response({"error": f"No fixture for {request.path}"}, status=404)
+
+        return await self.respond(fixture)
+
+    async def record(self, path: str, params: dict, query: dict):
+        from utils.http_client import get_json
+
+        # Forwarded with the API token, saved without it
+        status, body, _ = await get_json(f"{self.record_upstream}{path}", params=params)
+        fixture = self.add_fixture(path, [{"status": status, "body": body}], query)
+
+        name = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_")
+        target = self.fixtures_dir / f"{name}_{len(self.fixtures)}.json"
+        with open(target, "w") as f:
+            json.dump({key: fixture[key] for key in ("path", "query", "responses")}, f, indent=2)
+        logger.info(f"📼 Recorded {path} → {target}")
+        return fixture
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake blockchain API serving recorded fixtures")
+    parser.add_argument("--fixtures", required=True, type=Path)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--record", metavar="UPSTREAM_URL", help="forward and save unmatched requests")
+    args = parser.parse_args(argv)
+
+    args.fixtures.mkdir(parents=True, exist_ok=True)
+    provider = FakeProvider(args.fixtures, args.record)
+    provider.load()
+    web.run_app(provider.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    main()
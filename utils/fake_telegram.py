@@ -0,0 +1,136 @@
+"""Local stand-in for the Telegram Bot API, for exercising polling and webhook mode.
+
+Serves /bot<token>/<method>: getMe, setWebhook, deleteWebhook, getWebhookInfo, getUpdates
+(long polling) and sendMessage; any other method answers {"ok": true, "result": true}. Updates
+pushed with push_update() go to the registered webhook with the secret token header, or wait
+for getUpdates when no webhook is set. Every call is kept in `calls` with its arrival time.
+
+Usage: python -m utils.fake_telegram [--port 8089]
+Then set TELEGRAM_API_URL=http://127.0.0.1:8089
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger("escrow_bot")
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.webhook = None
+        self.updates = []
+        self.calls = []
+        self.pushed_at = {}
+        self._new_update = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._session = None
+
+    def message_update(self, user_id: int, text: str) -> dict:
+        """Builds a private-chat text message update"""
+        update_id = next(self._update_ids)
+        user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": user,
+                "text": text
+            }
+        }
+
+    async def push_update(self, update: dict) -> int:
+        """Delivers an update the way Telegram would; returns the webhook's HTTP status or 0 if queued"""
+        self.pushed_at[update["update_id"]] = time.perf_counter()
+        if not self.webhook:
+            self.updates.append(update)
+            self._new_update.set()
+            return 0
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        headers = {}
+        if self.webhook.get("secret_token"):
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.webhook["secret_token"]
+        async with self._session.post(self.webhook["url"], json=update, headers=headers) as response:
+            return response.status
+
+    async def get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset", 0))
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:int(params.get("limit", 100))]
+
+    def send_message(self, params: dict) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params["chat_id"]), "type": "private"},
+            "text": params.get("text", "")
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls.append((method, params, time.perf_counter()))
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Escrow Bot", "username": "escrow_test_bot"}
+        elif method == "setWebhook":
+            self.webhook = params
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook = None
+            result = True
+        elif method == "getWebhookInfo":
+            result = {"url": (self.webhook or {}).get("url", ""), "has_custom_certificate": False,
+                      "pending_update_count": len(self.updates)}
+        elif method == "getUpdates":
+            result = await self.get_updates(params)
+        elif method == "sendMessage":
+            result = self.send_message(params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.on_cleanup.append(self.close)
+        return app
+
+    async def close(self, app=None):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args(argv)
+
+    web.run_app(FakeTelegram().create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    main()
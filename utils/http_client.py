@@ -0,0 +1,65 @@
+import json
+import logging
+
+import aiohttp
+
+logger = logging.getLogger("escrow_bot")
+
+DEFAULT_HEADERS = {
+    "User-Agent": "EscrowBot/1.0",
+    "Accept": "application/json"
+}
+
+# Connection pool shared by all outgoing API calls
+MAX_CONNECTIONS = 50
+MAX_CONNECTIONS_PER_HOST = 10
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+DEFAULT_TIMEOUT = 15
+
+_session = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Returns the shared keep-alive session, creating it on first use"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            limit_per_host=MAX_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT
+        )
+        _session = aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def get_json(url: str, params: dict = None, timeout: float = DEFAULT_TIMEOUT) -> tuple:
+    """GETs a JSON resource, returns (status, data, headers); data is None if the body isn't JSON.
+
+    Raises asyncio.TimeoutError on timeout and aiohttp.ClientError on connection problems.
+    """
+    return await request_json("GET", url, params=params, timeout=timeout)
+
+
+async def request_json(method: str, url: str, params: dict = None, json_body=None,
+                       timeout: float = DEFAULT_TIMEOUT) -> tuple:
+    """Like get_json() for any method, optionally sending a JSON body"""
+    session = get_session()
+    async with session.request(
+        method, url, params=params, json=json_body, timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as response:
+        body = await response.read()
+        try:
+            data = json.loads(body) if body else None
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            data = None
+        return response.status, data, response.headers
+
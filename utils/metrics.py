@@ -0,0 +1,146 @@
+"""In-process metrics in the Prometheus text format, served at GET /metrics.
+
+Counters and histograms are updated inline; gauges are read from the components' existing
+stats() dicts only when /metrics is scraped.
+"""
+import bisect
+import functools
+import inspect
+import time
+
+from aiohttp import web
+
+# Latency buckets, seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_metrics = []
+_stats_sources = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> per-bucket counts (last one is +Inf), then the sum
+        self._series = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def timed(histogram: Histogram, *labels, errors: Counter = None):
+    """Decorator recording an async function's duration, and exceptions into `errors`"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(*labels)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, *labels)
+        return wrapper
+    return decorator
+
+
+def instrument_module(namespace: dict, histogram: Histogram, errors: Counter = None):
+    """Wraps every public coroutine function defined in a module with timed(), labelled by name.
+
+    Call it at the end of the module with globals(), before anything imports the functions.
+    """
+    module = namespace["__name__"]
+    for name, func in list(namespace.items()):
+        if name.startswith("_") or not inspect.iscoroutinefunction(func) or func.__module__ != module:
+            continue
+        namespace[name] = timed(histogram, name, errors=errors)(func)
+
+
+def register_stats(name: str, source, label: str = None):
+    """Exposes a stats() dict as gauges named escrow_<name>_<key>.
+
+    Nested dicts ({"blockcypher": {...}}) become one series per outer key, labelled `label`.
+    """
+    _stats_sources.append((name, source, label))
+
+
+def _render_stats(name: str, stats: dict, label: str) -> list:
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, dict) and label:
+            for inner_key, inner_value in value.items():
+                if isinstance(inner_value, (int, float)):
+                    lines.append(f'escrow_{name}_{inner_key}{{{label}="{_escape(key)}"}} {float(inner_value)}')
+        elif isinstance(value, (int, float)):
+            lines.append(f"escrow_{name}_{key} {float(value)}")
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for name, source, label in _stats_sources:
+        lines.extend(_render_stats(name, source(), label))
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+def register_routes(app: web.Application):
+    app.router.add_get("/metrics", handle_metrics)
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from dataclasses import dataclass
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from config import load_config
+from database.cache import TTLCache
+from database.db import add_outbox_message, delete_outbox_message, get_outbox_messages
+from utils.rate_limit import RateLimiter, TokenBucket
+
+config = load_config()
+logger = logging.getLogger("escrow_bot")
+
+# Longest pause between attempts after network or server errors (seconds)
+MAX_RETRY_DELAY = 60
+
+
+@dataclass(slots=True)
+class _Message:
+    id: int
+    chat_id: int
+    payload: dict
+    attempts: int = 0
+
+
+class Outbox:
+    """Queue of outgoing messages, delivered by background workers within Telegram's limits.
+
+    Messages to one chat go out in order, at most `per_chat_rate` per second; all chats share
+    `global_rate` per second. Flood control (RetryAfter) pauses every chat for the requested time,
+    network and server errors are retried with exponential backoff. With `persist` the queue is
+    kept in the database, so messages accepted before a restart are still delivered.
+    """
+
+    def __init__(self, workers: int = 8, global_rate: float = 25, per_chat_rate: float = 1,
+                 per_chat_burst: int = 3, max_attempts: int = 5, persist: bool = True):
+        self.workers = workers
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_attempts = max_attempts
+        self.persist = persist
+        self.bot = None
+        # No burst allowance: Telegram counts the overall limit over short windows
+        self.limiter = RateLimiter([TokenBucket(global_rate, 1)])
+        # A bucket idle for a minute is full again, so forgetting it changes nothing
+        self._chat_buckets = TTLCache(100000, 60)
+        # chat_id -> messages waiting; a chat with a lane is queued, scheduled or being sent
+        self._lanes = {}
+        self._ready = asyncio.Queue()
+        self._tasks = []
+        self._unfinished = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0}
+
+    async def start(self, bot):
+        """Starts the workers, picking up messages left in the database by the previous run"""
+        self.bot = bot
+        if self.persist:
+            pending = await get_outbox_messages()
+            for row in pending:
+                self._enqueue(_Message(row.id, row.chat_id, json.loads(row.payload)))
+            if pending:
+                logger.info(f"📨 Resuming {len(pending)} undelivered messages")
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float):
+        """Waits up to `timeout` seconds for queued messages to go out, then stops the workers"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ {self._unfinished} messages not sent before shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def send(self, chat_id: int, text: str, fallback: dict = None, **kwargs):
+        """Queues bot.send_message(chat_id, text, **kwargs) and returns without waiting for it.
+
+        `fallback` holds send() arguments of a message to queue instead if this one can't be delivered.
+        """
+        payload = {"text": text, **kwargs}
+        if payload.get("reply_markup") is not None:
+            payload["reply_markup"] = payload["reply_markup"].model_dump(mode="json", exclude_none=True)
+        if fallback:
+            payload["fallback"] = fallback
+
+        message_id = await add_outbox_message(chat_id, json.dumps(payload)) if self.persist else None
+        self._enqueue(_Message(message_id, chat_id, payload))
+
+    def _enqueue(self, message: _Message):
+        lane = self._lanes.get(message.chat_id)
+        if lane is None:
+            lane = self._lanes[message.chat_id] = deque()
+            self._ready.put_nowait(message.chat_id)
+        lane.append(message)
+        self._unfinished += 1
+        self._idle.clear()
+        self.stats["queued"] += 1
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    def _schedule(self, chat_id: int, delay: float):
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    async def _work(self):
+        while True:
+            chat_id = await self._ready.get()
+            try:
+                await self._serve(chat_id)
+            except Exception as e:
+                # The worker must survive, and the chat's lane must not be left without a turn
+                logger.error(f"❌ Outbox worker error for chat {chat_id}: {str(e)}")
+                if chat_id in self._lanes:
+                    self._schedule(chat_id, MAX_RETRY_DELAY)
+
+    async def _serve(self, chat_id: int):
+        """Sends the next message of a chat whose turn has come and schedules its next turn"""
+        wait = self._chat_bucket(chat_id).wait_time()
+        if wait > 0:
+            self._schedule(chat_id, wait)
+            return
+
+        lane = self._lanes[chat_id]
+        retry_in = await self._deliver(lane[0])
+        if retry_in is None:
+            lane.popleft()
+            self._finished()
+        if lane:
+            self._schedule(chat_id, retry_in or 0)
+        else:
+            del self._lanes[chat_id]
+
+    async def _deliver(self, message: _Message):
+        """Sends one message; returns seconds until the next attempt, or None once it is done with"""
+        await self.limiter.acquire()
+        self._chat_bucket(message.chat_id).consume()
+        payload = {key: value for key, value in message.payload.items() if key != "fallback"}
+        try:
+            await self.bot.send_message(message.chat_id, **payload)
+        except TelegramRetryAfter as e:
+            self.limiter.block(e.retry_after)
+            self.stats["retried"] += 1
+            return e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            message.attempts += 1
+            if message.attempts < self.max_attempts:
+                self.stats["retried"] += 1
+                return min(2 ** message.attempts, MAX_RETRY_DELAY)
+            error = e
+        except Exception as e:
+            # Blocked by the user, chat not found, bad markup: retrying won't help
+            error = e
+        else:
+            self.stats["sent"] += 1
+            await self._forget(message)
+            return None
+
+        self.stats["failed"] += 1
+        logger.error(f"❌ Error sending message to {message.chat_id}: {str(error)}")
+        await self._forget(message)
+        fallback = message.payload.get("fallback")
+        if fallback:
+            try:
+                await self.send(**fallback)
+            except Exception as e:
+                # The original is already forgotten, retrying it would send it twice
+                logger.error(f"❌ Error queueing fallback message to {message.chat_id}: {str(e)}")
+        return None
+
+    async def _forget(self, message: _Message):
+        if message.id is not None:
+            try:
+                await delete_outbox_message(message.id)
+            except Exception as e:
+                # Only means a duplicate after the next restart
+                logger.error(f"❌ Error removing delivered message {message.id}: {str(e)}")
+
+    def _finished(self):
+        self._unfinished -= 1
+        if not self._unfinished:
+            self._idle.set()
+
+    def queue_stats(self) -> dict:
+        return {**self.stats, "pending": self._unfinished, "chats": len(self._lanes)}
+
+
+# Shared outbox; main() starts it once the bot exists
+outbox = Outbox(
+    workers=config.outbox_workers,
+    global_rate=config.outbox_global_rate,
+    per_chat_rate=config.outbox_per_chat_rate,
+    per_chat_burst=config.outbox_per_chat_burst,
+    max_attempts=config.outbox_max_attempts,
+    persist=config.outbox_persist
+)
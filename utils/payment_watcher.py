@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+
+from config import load_config
+from database.db import (
+    deal_payment_window, get_deals_by_status, get_deal_with_participants, get_users_by_ids,
+    release_expired_addresses, update_deal_status
+)
+from database.models import DealStatus
+from utils.blockchain import check_transaction
+from utils.outbox import outbox
+from utils.rate_limit import Priority, TokenBucket
+
+config = load_config()
+logger = logging.getLogger("escrow_bot")
+
+# Deals whose deposit address is watched for an incoming payment
+WATCHED_STATUSES = (DealStatus.AWAITING_PAYMENT, DealStatus.PAID_WAITING_ADMIN)
+
+# Poll interval by deal age: (age up to, seconds between checks); older deals use MAX_POLL_INTERVAL
+POLL_SCHEDULE = (
+    (15 * 60, 30),
+    (2 * 3600, 120),
+    (24 * 3600, 600),
+)
+MAX_POLL_INTERVAL = 1800
+
+# Pause after a 429 without Retry-After, doubled on every consecutive one
+RATE_LIMIT_BACKOFF = 30
+MAX_RATE_LIMIT_BACKOFF = 900
+
+# Unused checks that may pile up while there is nothing to check; due deals checked
+# together are batched into few provider requests
+MAX_BURST = 50
+
+
+def deal_age(deal) -> float:
+    """Seconds since the deal was created (created_at is UTC from SQLite)"""
+    try:
+        created_at = datetime.fromisoformat(deal.created_at)
+    except (TypeError, ValueError):
+        return float("inf")
+    return (datetime.utcnow() - created_at.replace(tzinfo=None)).total_seconds()
+
+
+def poll_interval(age: float) -> float:
+    for max_age, interval in POLL_SCHEDULE:
+        if age < max_age:
+            return interval
+    return MAX_POLL_INTERVAL
+
+
+async def settle_payment(deal, tx_info: dict) -> bool:
+    """Marks a detected payment's deal as PAID and notifies both parties.
+
+    Safe to call repeatedly: only the caller whose status update applies sends notifications.
+    """
+    applied = await update_deal_status(
+        deal.id,
+        DealStatus.PAID,
+        expected_status=deal.status,
+        tx_hash=tx_info["tx_hash"]
+    )
+    if not applied:
+        # An admin confirmed it (or the deal was cancelled) in the meantime, or the transaction
+        # already settled another deal that used the address before
+        return False
+
+    logger.info(f"✅ Payment for deal {deal.id} detected automatically")
+    await notify_payment_received(deal.id, tx_info)
+    return True
+
+
+async def notify_payment_received(deal_id: str, tx_info: dict):
+    deal, buyer, seller = await get_deal_with_participants(deal_id)
+    messages = []
+    if buyer:
+        messages.append((
+            buyer.telegram_id,
+            f"✅ Payment for deal {deal_id} received!\n\n"
+            f"💰 Amount: {tx_info['amount']:.6f} {deal.crypto_type}\n"
+            f"Now the seller should send the item. You will be notified when they do."
+        ))
+    else:
+        logger.warning(f"⚠️ Buyer not found for deal {deal_id}")
+    if seller:
+        messages.append((
+            seller.telegram_id,
+            f"💰 Deal {deal_id} is paid!\n\n"
+            f"Send the item to the buyer and click 'Item shipped' in the deal."
+        ))
+    else:
+        logger.warning(f"⚠️ Seller not found for deal {deal_id}")
+
+    for chat_id, text in messages:
+        await outbox.send(chat_id, text, parse_mode="HTML")
+
+
+async def expire_unpaid_deals():
+    """Releases expired address reservations and tells buyers their unpaid deals were cancelled"""
+    cancelled = await release_expired_addresses()
+    if not cancelled:
+        return
+
+    buyers = await get_users_by_ids([deal.buyer_id for deal in cancelled])
+    for deal in cancelled:
+        buyer = buyers.get(deal.buyer_id)
+        if not buyer:
+            logger.warning(f"⚠️ Buyer not found for cancelled deal {deal.id}")
+            continue
+        await outbox.send(
+            buyer.telegram_id,
+            f"⌛ Deal {deal.id} was cancelled: no payment arrived at its deposit address in time.\n\n"
+            f"Do NOT send anything to its deposit address anymore, create a new deal instead.",
+            parse_mode="HTML"
+        )
+
+
+class PaymentWatcher:
+    """Polls deposit addresses of open deals and marks paid deals as PAID"""
+
+    def __init__(self, concurrency: int = 20, checks_per_hour: int = 180, webhooks=None):
+        # With a webhook registered for an address, polling is only a safety net
+        self.webhooks = webhooks
+        self.concurrency = max(1, concurrency)
+        self.budget = TokenBucket(checks_per_hour / 3600, MAX_BURST)
+        self._next_check = {}
+        self._paused_until = 0.0
+        self._rate_limit_strikes = 0
+        self.stats = {"checks": 0, "confirmed": 0, "rate_limited": 0, "errors": 0}
+
+    def _interval(self, deal) -> float:
+        if self.webhooks and self.webhooks.is_hooked(deal.deposit_address):
+            return MAX_POLL_INTERVAL
+        return poll_interval(deal_age(deal))
+
+    def _schedule(self, deal, now: float):
+        self._next_check[deal.id] = now + self._interval(deal)
+
+    def _on_rate_limited(self, retry_after: float, now: float):
+        self.stats["rate_limited"] += 1
+        backoff = min(RATE_LIMIT_BACKOFF * 2 ** self._rate_limit_strikes, MAX_RATE_LIMIT_BACKOFF)
+        self._rate_limit_strikes += 1
+        self._paused_until = max(self._paused_until, now + (retry_after or backoff))
+        logger.warning(f"⚠️ Payment watcher backing off, pausing for {self._paused_until - now:.0f}s")
+
+    async def tick(self):
+        """Checks the open deals whose turn has come, within the API budget"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return
+
+        deals = await get_deals_by_status(WATCHED_STATUSES)
+        open_ids = {deal.id for deal in deals}
+        for deal_id in list(self._next_check):
+            if deal_id not in open_ids:
+                del self._next_check[deal_id]
+
+        for deal in deals:
+            if deal.id not in self._next_check:
+                # Spread first checks so a restart doesn't hit the API with every deal at once
+                self._next_check[deal.id] = now + random.uniform(0, self._interval(deal))
+
+        due = sorted(
+            (deal for deal in deals if self._next_check[deal.id] <= now),
+            key=lambda deal: self._next_check[deal.id]
+        )
+        due = due[:self.budget.available()]
+        if not due:
+            return
+
+        self.budget.consume(len(due))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(deal):
+            async with semaphore:
+                if time.monotonic() < self._paused_until:
+                    return
+                await self._check_deal(deal)
+
+        await asyncio.gather(*(check(deal) for deal in due))
+
+    async def _check_deal(self, deal):
+        self.stats["checks"] += 1
+        since, until = deal_payment_window(deal)
+        tx_info = await check_transaction(
+            deal.crypto_type, deal.deposit_address, deal.amount,
+            priority=Priority.BACKGROUND,
+            since=since,
+            until=until
+        )
+        now = time.monotonic()
+
+        if "retry_after" in tx_info:
+            # Rate limited or provider down; the deal stays due and is checked first after the pause
+            self._on_rate_limited(tx_info.get("retry_after"), now)
+            return
+
+        self._rate_limit_strikes = 0
+        if not tx_info.get("confirmed", False):
+            self._schedule(deal, now)
+            return
+
+        self._next_check.pop(deal.id, None)
+        if await settle_payment(deal, tx_info):
+            self.stats["confirmed"] += 1
+
+    async def run(self, interval: float):
+        """Scans open deals every `interval` seconds until cancelled"""
+        logger.info(
+            f"🔁 Payment watcher started (scan every {interval}s, "
+            f"{self.budget.rate * 3600:.0f} checks/hour, {self.concurrency} in parallel)"
+        )
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.exception(f"❌ Error in payment watcher: {str(e)}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,146 @@
+"""Push-based payment detection through BlockCypher tx-confirmation webhooks.
+
+A callback is only a hint: the bot re-checks the addresses it names with the configured provider
+and never trusts the pushed amounts or confirmation counts. The callback endpoint is POST /webhooks/blockcypher/<secret> on the bot's web server. A recorded
+callback can be replayed locally with:
+
+    curl -X POST -H "Content-Type: application/json" -d @callback.json \
+        http://127.0.0.1:8080/webhooks/blockcypher/<secret>
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+
+import aiohttp
+from aiohttp import web
+
+from config import load_config
+from database.db import deal_payment_window, get_address_hooks, get_deal_by_id, get_deals_by_status, set_address_hook
+from utils.blockchain import BlockCypherProvider, ProviderError, check_transaction, forget_address, get_provider
+from utils.payment_watcher import WATCHED_STATUSES, settle_payment
+from utils.rate_limit import Priority
+
+config = load_config()
+logger = logging.getLogger("escrow_bot")
+
+
+def webhook_secret() -> str:
+    """Path secret of the callback URL; derived from ENCRYPTION_KEY unless set, so it survives restarts"""
+    if config.payment_webhook_secret:
+        return config.payment_webhook_secret
+    return hashlib.sha256(f"payment-webhook:{config.encryption_key}".encode()).hexdigest()[:32]
+
+
+class PaymentWebhooks:
+    """Address→deals index for open deals, the callback endpoint and hook (un)registration"""
+
+    def __init__(self, public_url: str = "", secret: str = None):
+        self.public_url = public_url.rstrip("/")
+        self.secret = secret or webhook_secret()
+        self._deals = {}
+        self._hooked = set()
+        self.stats = {"callbacks": 0, "settled": 0, "ignored": 0, "registered": 0, "unregistered": 0}
+
+    @property
+    def callback_url(self) -> str:
+        return f"{self.public_url}/webhooks/blockcypher/{self.secret}"
+
+    def register_routes(self, app: web.Application):
+        app.router.add_post("/webhooks/blockcypher/{secret}", self.handle_callback)
+
+    def is_hooked(self, address: str) -> bool:
+        return address in self._hooked
+
+    async def sync(self):
+        """Rebuilds the address index and registers/unregisters hooks as deals open and close"""
+        deals = await get_deals_by_status(WATCHED_STATUSES)
+        index = {}
+        for deal in deals:
+            index.setdefault(deal.deposit_address, []).append((deal.id, deal.crypto_type))
+        for address, open_deals in index.items():
+            if len(open_deals) > 1:
+                # Each is checked against its own reservation window, a payment settles one of them
+                logger.warning(
+                    f"⚠️ Address {address} is used by several open deals: "
+                    f"{', '.join(deal_id for deal_id, _ in open_deals)}"
+                )
+        self._deals = index
+        if not self.public_url:
+            return
+
+        hooks = await get_address_hooks()
+        for address, (crypto_type, hook_id) in list(hooks.items()):
+            if address in self._deals:
+                continue
+            # Address released or its deal settled/cancelled
+            try:
+                await get_provider(crypto_type).unregister_hook(crypto_type, hook_id)
+            except (ProviderError, asyncio.TimeoutError, aiohttp.ClientError) as e:
+                logger.warning(f"⚠️ Could not remove payment hook for {address}: {str(e)}")
+                continue
+            await set_address_hook(address, None)
+            del hooks[address]
+            self.stats["unregistered"] += 1
+
+        for address, [(deal_id, crypto_type), *_] in self._deals.items():
+            if address in hooks:
+                continue
+            provider = get_provider(crypto_type)
+            if not provider.supports_hooks:
+                continue
+            try:
+                hook_id = await provider.register_hook(
+                    crypto_type, address, self.callback_url, config.min_confirmations[crypto_type]
+                )
+            except (ProviderError, asyncio.TimeoutError, aiohttp.ClientError) as e:
+                # Most likely affects every address; polling covers them until the next sync
+                logger.warning(f"⚠️ Could not register payment hook for deal {deal_id}: {str(e)}")
+                break
+            await set_address_hook(address, hook_id)
+            hooks[address] = (crypto_type, hook_id)
+            self.stats["registered"] += 1
+
+        self._hooked = {address for address in hooks if address in self._deals}
+
+    async def handle_callback(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.match_info["secret"], self.secret):
+            return web.Response(status=403)
+        try:
+            tx = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="invalid JSON")
+        if not isinstance(tx, dict) or not tx.get("hash"):
+            return web.Response(status=400, text="not a transaction")
+
+        self.stats["callbacks"] += 1
+        settled = await self.process_transaction(tx)
+        # Always 200 for well-formed callbacks, otherwise the provider keeps retrying
+        return web.json_response({"settled": settled})
+
+    async def process_transaction(self, tx: dict) -> list:
+        """Re-checks the open deals whose addresses a pushed transaction names; returns the settled deal ids"""
+        settled = []
+        addresses = BlockCypherProvider.parse_output_values(tx, self._deals)
+        if not addresses:
+            self.stats["ignored"] += 1
+            return settled
+
+        for address in addresses:
+            # A cached answer may predate the pushed transaction
+            forget_address(self._deals[address][0][1], address)
+            for deal_id, crypto_type in self._deals[address]:
+                deal = await get_deal_by_id(deal_id)
+                if not deal or deal.status not in WATCHED_STATUSES:
+                    continue  # repeated callback for an already settled deal
+
+                since, until = deal_payment_window(deal)
+                # No user is waiting on the callback, so it must not take interactive capacity
+                tx_info = await check_transaction(
+                    crypto_type, address, deal.amount, priority=Priority.BACKGROUND, since=since, until=until
+                )
+                if tx_info["confirmed"] and await settle_payment(deal, tx_info):
+                    self.stats["settled"] += 1
+                    settled.append(deal_id)
+
+        return settled
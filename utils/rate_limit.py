@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger("escrow_bot")
+
+
+class Priority:
+    """Lanes of a RateLimiter; lower values are served first"""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def available(self) -> int:
+        self._refill()
+        return int(self.tokens)
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` can be taken"""
+        self._refill()
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def consume(self, tokens: float = 1):
+        self._refill()
+        self.tokens -= tokens
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        if self.wait_time(tokens) > 0:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+class RateLimiter:
+    """Token buckets shared by all callers; waiting callers are served by priority, then FIFO"""
+
+    def __init__(self, buckets: list):
+        self.buckets = buckets
+        self._queue = []
+        self._order = itertools.count()
+        self._blocked_until = 0.0
+        self._dispatcher = None
+        self.stats = {"granted": 0, "queued": 0, "rejected": 0}
+
+    def block(self, seconds: float):
+        """Holds back all requests, e.g. for a provider's Retry-After"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def wait_time(self, tokens: float = 1) -> float:
+        # A request costing more than a bucket holds waits for a full bucket and leaves it in debt
+        blocked = self._blocked_until - time.monotonic()
+        return max([blocked, 0.0] + [bucket.wait_time(min(tokens, bucket.capacity)) for bucket in self.buckets])
+
+    def _take(self, tokens: float):
+        for bucket in self.buckets:
+            bucket.consume(tokens)
+        self.stats["granted"] += 1
+
+    async def acquire(self, priority: int = Priority.INTERACTIVE, max_wait: float = None, tokens: float = 1):
+        """Waits for a request slot costing `tokens`; raises RateLimitExceeded if it takes longer than max_wait"""
+        wait = self.wait_time(tokens)
+        if not self._queue and wait == 0:
+            self._take(tokens)
+            return
+
+        if max_wait is not None and wait > max_wait:
+            self.stats["rejected"] += 1
+            raise RateLimitExceeded(wait)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._order), future, tokens))
+        self.stats["queued"] += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            # wait_for cancels the future on timeout, the dispatcher then skips it
+            await asyncio.wait_for(future, max_wait)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise RateLimitExceeded(self.wait_time(tokens)) from None
+
+    async def _dispatch(self):
+        while self._queue:
+            _, _, future, tokens = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+
+            wait = self.wait_time(tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            heapq.heappop(self._queue)
+            self._take(tokens)
+            future.set_result(None)
+
+
+class CircuitBreaker:
+    """Fails fast after `failure_threshold` consecutive failures, probing again every `reset_timeout` seconds"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self._opened_at >= self.reset_timeout:
+            # Let one probe through; the circuit closes again if it succeeds
+            self._opened_at = now
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info(f"✅ Circuit for {self.name} closed, provider is back")
+        self.failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning(f"⚠️ Circuit for {self.name} opened after {self.failures} failures")
+            self._opened_at = time.monotonic()
@@ -0,0 +1,39 @@
+import asyncio
+import logging
+import signal
+
+logger = logging.getLogger("escrow_bot")
+
+
+async def run_periodically(func, interval: float, name: str):
+    """Runs an async function every `interval` seconds until cancelled"""
+    logger.info(f"🔁 Background task '{name}' started (every {interval}s)")
+    while True:
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"❌ Error in background task '{name}': {str(e)}")
+        await asyncio.sleep(interval)
+
+
+async def wait_for_shutdown():
+    """Returns once the process gets SIGINT or SIGTERM"""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    signals = (signal.SIGINT, signal.SIGTERM)
+    for sig in signals:
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+
+
+async def cancel_tasks(tasks: list):
+    """Cancels background tasks and waits for them to finish"""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
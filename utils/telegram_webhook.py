@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config import load_config
+
+config = load_config()
+logger = logging.getLogger("escrow_bot")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def telegram_secret_token() -> str:
+    """Secret Telegram sends with every update; derived from ENCRYPTION_KEY unless set"""
+    if config.telegram_webhook_secret:
+        return config.telegram_webhook_secret
+    return hashlib.sha256(f"telegram-webhook:{config.encryption_key}".encode()).hexdigest()
+
+
+class TelegramWebhook:
+    """Receives Telegram updates over HTTPS and feeds them to the dispatcher.
+
+    At most `max_concurrent` updates are handled at once. When all slots stay busy for
+    `accept_timeout` seconds the request gets a 503 and Telegram redelivers the update later.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, secret_token: str, max_concurrent: int = 50,
+                 accept_timeout: float = 5):
+        self.dp = dp
+        self.bot = bot
+        self.secret_token = secret_token
+        self.accept_timeout = accept_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._tasks = set()
+        self._closing = False
+        self.stats = {"received": 0, "handled": 0, "failed": 0, "rejected": 0, "handle_seconds": 0.0}
+
+    def register_routes(self, app: web.Application, path: str):
+        app.router.add_post(path, self.handle_request)
+
+    async def handle_request(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            return web.Response(status=403)
+        if self._closing:
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            return web.Response(status=400)
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.accept_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            return web.Response(status=503)
+
+        self.stats["received"] += 1
+        task = asyncio.create_task(self._process(update, time.perf_counter()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        # Answer right away; Telegram waits for the response before sending the next update
+        return web.Response()
+
+    async def _process(self, update: Update, received_at: float):
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.stats["handled"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.exception(f"❌ Error handling update {update.update_id}: {str(e)}")
+        finally:
+            self.stats["handle_seconds"] += time.perf_counter() - received_at
+            self._slots.release()
+
+    async def drain(self, timeout: float):
+        """Stops accepting updates and waits for the ones in progress, cancelling them after `timeout`"""
+        self._closing = True
+        if not self._tasks:
+            return
+
+        logger.info(f"⏳ Waiting for {len(self._tasks)} updates in progress...")
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"⚠️ {len(pending)} updates cancelled after {timeout}s drain timeout")
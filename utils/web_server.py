@@ -0,0 +1,27 @@
+import logging
+
+from aiohttp import web
+
+logger = logging.getLogger("escrow_bot")
+
+
+class WebServer:
+    """aiohttp server running inside the bot's event loop; add routes to `app` before start()"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self._runner = None
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"🌐 Web server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("✅ Web server stopped")